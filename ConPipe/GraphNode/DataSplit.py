@@ -1,36 +1,59 @@
-
 import inspect
+import numpy as np
 
 from ConPipe.ModuleLoader import get_function
+from ConPipe.indexing import num_samples, take
 
 
-'''
-TODO: make a split class wrapper to allow using all the sklearn split classes  
-if inspect.isclass(self.data_split_function):
-            train_idx, test_idx = next(self.data_split_function(
-                **self.parameters
-            ).split(X,y,group))
-
-        else:
-'''
-
 class DataSplit():
 
-    def __init__(self, function, parameters):
+    def __init__(self, function, parameters, return_indices=False):
         self.parameters = parameters
+        self.return_indices = return_indices
         self.data_split_function = get_function(function)
 
     def run(self, *args, **kwargs):
 
-        X_train, X_test, y_train, y_test = self.data_split_function(
-            *args,
-            **kwargs,
-            **self.parameters
-        )
+        # sklearn split classes (e.g. ShuffleSplit) split by indices, its first split is used
+        if inspect.isclass(self.data_split_function):
+            train_idx, test_idx = next(self.data_split_function(
+                **self.parameters
+            ).split(*args, **kwargs))
+
+        elif self.return_indices:
+            # Split functions like train_test_split shuffle the same way any array of the same
+            # length, the other inputs (e.g. stratify) are still passed to the function
+            train_idx, test_idx = self.data_split_function(
+                np.arange(num_samples(args[0])),
+                **kwargs,
+                **self.parameters
+            )
 
+        else:
+            X_train, X_test, y_train, y_test = self.data_split_function(
+                *args,
+                **kwargs,
+                **self.parameters
+            )
+
+            return {
+                'X_train': X_train,
+                'X_test': X_test,
+                'y_train': y_train,
+                'y_test': y_test
+            }
+
+        if self.return_indices:
+            return {
+                'train_idx': train_idx,
+                'test_idx': test_idx
+            }
+
+        X = args[0]
+        y = args[1] if len(args) > 1 else kwargs['y']
         return {
-            'X_train': X_train,
-            'X_test': X_test,
-            'y_train': y_train,
-            'y_test': y_test
+            'X_train': take(X, train_idx),
+            'X_test': take(X, test_idx),
+            'y_train': take(y, train_idx),
+            'y_test': take(y, test_idx)
         }
@@ -0,0 +1,328 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+from ConPipe.Logger import Logger
+from ConPipe.ModuleLoader import get_class, get_function
+from ConPipe.storage import save_value, load_value
+from ConPipe.indexing import num_samples, take
+from sklearn.base import is_classifier
+from sklearn.metrics import make_scorer
+
+
+class IncrementalTraining():
+    """ Trains an estimator that supports partial_fit (e.g. SGDClassifier, MultinomialNB or
+    MLPClassifier) one batch at a time, so the training data never has to be in memory. X and
+    y are either arrays (e.g. npy_mmap memory maps) split in batches of batch_size rows or
+    the batch iterators of streamed inputs (see stream_inputs).
+    """
+
+    def __init__(self, model, epochs=1, batch_size=10000, classes=None, shuffle=False,
+                 random_state=None, validation=None, checkpoint=None):
+
+        self.model = model
+        self.epochs = int(epochs)
+        self.batch_size = int(batch_size)
+        self.classes = np.asarray(classes) if classes is not None else None
+        self.shuffle = shuffle
+        self.random_state = random_state
+        self.validation = validation if validation is not None else {}
+        self.checkpoint = checkpoint if checkpoint is not None else {}
+
+        self.scorer = None
+        if 'scoring' in self.validation:
+            self.scorer = make_scorer(
+                get_function(self.validation['scoring']['function']),
+                **self.validation['scoring'].get('parameters', {})
+            )
+
+        # Checkpoints are only resumed by a node with the same parameters
+        self.fingerprint_ = hashlib.sha256(json.dumps(
+            {
+                'model': model,
+                'epochs': epochs,
+                'batch_size': batch_size,
+                'classes': classes,
+                'shuffle': shuffle,
+                'random_state': random_state,
+                'validation': validation
+            },
+            sort_keys=True,
+            default=str
+        ).encode('utf-8')).hexdigest()
+
+        self.logger = Logger()
+
+    def run(self, X, y, X_val=None, y_val=None, sample_idx=None):
+        # With sample_idx X and y are the upstream arrays and only those rows are used
+
+        estimator = get_class(self.model['class'])(**self.model.get('constructor_params', {}))
+        fit_params = dict(self.model.get('fit_params', {}))
+
+        streamed = isinstance(X, Iterator) or isinstance(y, Iterator)
+        if is_classifier(estimator):
+            fit_params['classes'] = self._classes(y, sample_idx, streamed)
+
+        # Next batch to train and validation scores of the previous runs of this training
+        state = {'epoch': 0, 'batch': 0, 'n_samples': 0, 'n_batches': 0}
+        history = []
+        checkpoint = self._load_checkpoint()
+        if checkpoint is not None:
+            estimator, state, history = checkpoint['estimator'], checkpoint['state'], checkpoint['history']
+            self.logger(1, f'Resume training from epoch {state["epoch"]} batch {state["batch"]}')
+
+        holdout = _Holdout(
+            self.validation.get('fraction', 0.0),
+            int(self.validation.get('max_samples', 10000)),
+            self.random_state,
+            X_val,
+            y_val
+        )
+        if checkpoint is not None and checkpoint['holdout'] is not None:
+            holdout = checkpoint['holdout']
+        elif not streamed:
+            # Array holdouts are collected before the training, so every validation uses the same rows
+            for chunk_id, rows in enumerate(self._chunk_rows(X, sample_idx)):
+                holdout.collect(chunk_id, rows, X, y)
+        validate_every = self.validation.get('every', None)
+        checkpoint_every = self.checkpoint.get('every', None)
+
+        start_time = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix='ConPipe-spill-') as spill_dir:
+            spill = _Spill(spill_dir, enabled=streamed and self.epochs - state['epoch'] > 1)
+
+            for epoch in range(state['epoch'], self.epochs):
+                self.logger(2, f'Epoch {epoch + 1}/{self.epochs}')
+
+                for position, (chunk_id, X_batch, y_batch) in enumerate(
+                    self._epoch_batches(X, y, sample_idx, epoch, streamed, spill)
+                ):
+                    X_batch, y_batch = holdout.split(chunk_id, X_batch, y_batch)
+
+                    # Batches trained before the checkpoint are skipped
+                    if epoch == state['epoch'] and position < state['batch']:
+                        continue
+
+                    if len(y_batch) > 0:
+                        estimator.partial_fit(X_batch, y_batch, **fit_params)
+
+                    state = {
+                        'epoch': epoch,
+                        'batch': position + 1,
+                        'n_samples': state['n_samples'] + len(y_batch),
+                        'n_batches': state['n_batches'] + 1
+                    }
+
+                    if validate_every is not None and state['n_batches'] % int(validate_every) == 0:
+                        history.append(self._validate(estimator, holdout, state, start_time))
+
+                    if checkpoint_every is not None and state['n_batches'] % int(checkpoint_every) == 0:
+                        self._save_checkpoint(estimator, state, history, holdout)
+
+                # Epochs are also validated at their end, unless its last batch was validated
+                if len(history) == 0 or (history[-1]['epoch'], history[-1]['batch']) != (epoch + 1, state['batch']):
+                    history.append(self._validate(estimator, holdout, state, start_time))
+                state = {**state, 'epoch': epoch + 1, 'batch': 0}
+                self._save_checkpoint(estimator, state, history, holdout)
+
+        # A finished training is never resumed, its inputs may change in the next run
+        if 'path' in self.checkpoint and os.path.exists(self.checkpoint['path']):
+            os.remove(self.checkpoint['path'])
+
+        return {
+            'estimator': estimator,
+            'history': pd.DataFrame(history)
+        }
+
+    def _classes(self, y, sample_idx, streamed):
+
+        if self.classes is not None:
+            return self.classes
+
+        if streamed:
+            raise ValueError('The classes parameter is required to train a classifier with streamed inputs')
+
+        return np.unique(y if sample_idx is None else take(y, sample_idx))
+
+    def _epoch_batches(self, X, y, sample_idx, epoch, streamed, spill):
+        """ (chunk_id, X_batch, y_batch) of an epoch, chunk_id identifies the batch rows in every epoch """
+
+        if streamed:
+            # Streams can only be read once, the next epochs read the batches spilled to disk
+            if spill.n_batches is not None:
+                yield from spill.batches()
+                return
+
+            chunk_id = -1
+            for chunk_id, (X_batch, y_batch) in enumerate(zip(X, y)):
+                spill.save(chunk_id, X_batch, y_batch)
+                yield chunk_id, X_batch, y_batch
+            spill.n_batches = chunk_id + 1
+            return
+
+        chunks = list(enumerate(self._chunk_rows(X, sample_idx)))
+        if self.shuffle:
+            chunks = [chunks[i] for i in np.random.RandomState(_seed(self.random_state, epoch)).permutation(len(chunks))]
+
+        # Rows are only taken batch by batch, so memory maps are read one batch at a time
+        for chunk_id, rows in chunks:
+            yield chunk_id, take(X, rows), take(y, rows)
+
+    def _chunk_rows(self, X, sample_idx):
+        """ Rows of X of each batch, in their original order """
+
+        n_samples = len(sample_idx) if sample_idx is not None else num_samples(X)
+        for start in range(0, n_samples, self.batch_size):
+            rows = np.arange(start, min(start + self.batch_size, n_samples))
+            yield sample_idx[rows] if sample_idx is not None else rows
+
+    def _validate(self, estimator, holdout, state, start_time):
+
+        score = None
+        X_val, y_val = holdout.data()
+        if X_val is not None and len(y_val) > 0:
+            if self.scorer is not None:
+                score = self.scorer(estimator, X_val, y_val)
+            else:
+                score = estimator.score(X_val, y_val)
+
+        self.logger(2, f'Epoch {state["epoch"] + 1} batch {state["batch"]}: {state["n_samples"]} samples, score {score}', 1)
+
+        return {
+            'epoch': state['epoch'] + 1,
+            'batch': state['batch'],
+            'n_samples': state['n_samples'],
+            'score': score,
+            'time': time.perf_counter() - start_time
+        }
+
+    def _load_checkpoint(self):
+
+        path = self.checkpoint.get('path', None)
+        if path is None or not os.path.exists(path):
+            return None
+
+        checkpoint = load_value(path, 'pickle')
+        if checkpoint.get('fingerprint', None) != self.fingerprint_:
+            self.logger(1, f'Checkpoint {path} is from a training with other parameters, it is ignored')
+            return None
+
+        return checkpoint
+
+    def _save_checkpoint(self, estimator, state, history, holdout):
+
+        path = self.checkpoint.get('path', None)
+        if path is None:
+            return
+
+        if os.path.dirname(path) != '':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        save_value(
+            {
+                'fingerprint': self.fingerprint_,
+                'estimator': estimator,
+                'state': state,
+                'history': history,
+                # Given validation data is not saved, the node receives it again
+                'holdout': holdout if holdout.fraction > 0 else None
+            },
+            path,
+            'pickle'
+        )
+        self.logger(4, f'Checkpoint saved to {path}', 1)
+
+
+class _Holdout():
+    """ Validation rows. Given X and y are used as they are, otherwise a fraction of the rows of
+    each batch (the same rows in every epoch) is held out of the training and up to max_samples
+    of them are kept to validate.
+    """
+
+    def __init__(self, fraction, max_samples, random_state=None, X=None, y=None):
+
+        self.fraction = float(fraction) if X is None else 0.0
+        self.max_samples = max_samples
+        self.random_state = random_state
+
+        self.n_samples = 0
+        self._chunks = set()
+        self._X = [X] if X is not None else []
+        self._y = [y] if y is not None else []
+        self._data = None
+
+    def collect(self, chunk_id, rows, X, y):
+        """ Keeps the held out rows of a batch, whose rows are these positions of X and y """
+
+        if self.fraction <= 0 or chunk_id in self._chunks:
+            return
+
+        self._chunks.add(chunk_id)
+        rows = rows[self._held_out(chunk_id, len(rows))][:max(self.max_samples - self.n_samples, 0)]
+        if len(rows) > 0:
+            self._X.append(take(X, rows))
+            self._y.append(take(y, rows))
+            self.n_samples += len(rows)
+            self._data = None
+
+    def split(self, chunk_id, X, y):
+        """ Training rows of a batch """
+
+        if self.fraction <= 0:
+            return X, y
+
+        self.collect(chunk_id, np.arange(len(y)), X, y)
+        rows = np.flatnonzero(~self._held_out(chunk_id, len(y)))
+        return take(X, rows), take(y, rows)
+
+    def data(self):
+
+        if len(self._X) == 0:
+            return None, None
+
+        if self._data is None:
+            self._data = (_concat(self._X), _concat(self._y))
+        return self._data
+
+    def _held_out(self, chunk_id, n_rows):
+        return np.random.RandomState(_seed(self.random_state, chunk_id)).rand(n_rows) < self.fraction
+
+    def __getstate__(self):
+        return {**self.__dict__, '_data': None}
+
+
+class _Spill():
+    """ Batches of a stream saved to a directory to read them again in the next epochs """
+
+    def __init__(self, directory, enabled):
+        self.directory = directory
+        self.enabled = enabled
+        self.n_batches = None
+
+    def save(self, chunk_id, X, y):
+        if self.enabled:
+            save_value((X, y), self._path(chunk_id), 'pickle5')
+
+    def batches(self):
+        for chunk_id in range(self.n_batches):
+            X, y = load_value(self._path(chunk_id), 'pickle5')
+            yield chunk_id, X, y
+
+    def _path(self, chunk_id):
+        return os.path.join(self.directory, f'{chunk_id:06d}.pickle5')
+
+
+def _seed(random_state, index):
+    return [random_state if random_state is not None else 0, int(index)]
+
+
+def _concat(parts):
+    if hasattr(parts[0], 'iloc'):
+        return pd.concat(parts)
+    return np.concatenate(parts)
@@ -1,16 +1,52 @@
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 from ConPipe.Logger import Logger
 from ConPipe.ModuleLoader import get_class
+from ConPipe.indexing import take
 
+from joblib import Parallel, delayed
 from sklearn.base import clone
 
+# sklearn classifiers whose predict is the most probable class of predict_proba
+ARGMAX_CLASSIFIERS = (
+    'LogisticRegression',
+    'LogisticRegressionCV',
+    'MLPClassifier',
+    'DecisionTreeClassifier',
+    'ExtraTreeClassifier',
+    'RandomForestClassifier',
+    'ExtraTreesClassifier',
+    'GradientBoostingClassifier',
+    'HistGradientBoostingClassifier',
+    'AdaBoostClassifier',
+    'KNeighborsClassifier',
+    'GaussianNB',
+    'MultinomialNB',
+    'BernoulliNB',
+    'ComplementNB',
+    'CategoricalNB',
+    'LinearDiscriminantAnalysis',
+    'QuadraticDiscriminantAnalysis',
+    'CalibratedClassifierCV'
+)
+
 
 class ModelPrediction():
 
-    def __init__(self, fit_model=False, cv=None):
+    def __init__(self, fit_model=False, cv=None, n_jobs=None, return_indices=False,
+                 chunk_size=None, chunk_n_jobs=None, single_pass='auto'):
 
         self.fit_model = fit_model
+        self.n_jobs = int(n_jobs) if n_jobs is not None else None
+        self.return_indices = return_indices
+
+        # Inference engine settings, see _predict
+        self.predict_params = {
+            'chunk_size': int(chunk_size) if chunk_size is not None else None,
+            'n_jobs': int(chunk_n_jobs) if chunk_n_jobs is not None else None,
+            'single_pass': single_pass
+        }
 
         self.cv = None
         if cv is not None:
@@ -18,12 +54,25 @@ class ModelPrediction():
         
         self.logger = Logger()
     
-    def run(self, estimator, X, y, group_test=None, X_train=None, y_train=None):
+    def run(self, estimator, X, y, group_test=None, X_train=None, y_train=None,
+            sample_idx=None, train_idx=None):
+        # With sample_idx (and train_idx) X, y (and X_train, y_train) are the upstream arrays
+        # and only those rows are used. X rows are taken on demand, by fold or prediction chunk.
+
+        outputs = {}
+
+        if sample_idx is not None:
+            y = take(y, sample_idx)
+            group_test = np.asarray(group_test)[sample_idx] if group_test is not None else None
 
         if self.fit_model and self.cv is not None:
             raise ValueError('fit_model cannot be True if cv is not None')
 
         if self.fit_model:
+            if train_idx is not None:
+                X_train = take(X_train if X_train is not None else X, train_idx)
+                y_train = take(y_train, train_idx) if y_train is not None else None
+
             if X_train is None or y_train is None:
                 raise ValueError(
                     "X_train and y_train can't be None if fit_model is True")
@@ -32,38 +81,44 @@ class ModelPrediction():
                 estimator,
                 X, y,
                 X_train,
-                y_train
+                y_train,
+                sample_idx
             )
 
         elif self.cv is not None:
-            y_true, y_pred, y_probas, classes = self._run_cv(
+            y_true, y_pred, y_probas, classes, oof_index = self._run_cv(
                 estimator,
                 X, y,
-                group_test
+                group_test,
+                sample_idx
             )
 
+            if self.return_indices:
+                outputs['oof_index'] = oof_index
+
         else:
 
             y_true, y_pred, y_probas, classes = self._run_simple(
                 estimator,
-                X, y
+                X, y,
+                sample_idx
             )
 
         return {
             'y_true': y_true,
             'y_pred': y_pred,
             'y_probas': y_probas,
-            'classes': classes
+            'classes': classes,
+            **outputs
         }
 
-    def _run_re_fit(self, estimator, X, y, X_train, y_train):
+    def _run_re_fit(self, estimator, X, y, X_train, y_train, sample_idx=None):
 
         estimator = clone(estimator)
 
         estimator.fit(X_train, y_train)
 
-        y_pred = estimator.predict(X)
-        y_probas = estimator.predict_proba(X)
+        y_pred, y_probas = _predict(estimator, X, sample_idx=sample_idx, **self.predict_params)
 
         return [
             y,
@@ -72,40 +127,55 @@ class ModelPrediction():
             estimator.classes_
         ]
     
-    def _run_cv(self, estimator, X, y, group=None):
-
-        estimator = clone(estimator)
+    def _run_cv(self, estimator, X, y, group=None, sample_idx=None):
 
-        split_data = [X, y]
+        # Splitters only use X for its number of samples
+        split_data = [X if sample_idx is None else np.empty((len(sample_idx), 0)), y]
         if group is not None:
             split_data.append(group)
 
-        y_true_all = []
-        y_pred_all = []
-        y_probas_all = []
-        for train_idx, test_idx in self.cv.split(*split_data):
-            X_train, X_test = X[train_idx], X[test_idx]
-            y_train, y_test = y[train_idx], y[test_idx]
+        folds = list(self.cv.split(*split_data))
 
-            estimator.fit(X_train, y_train)
-            y_pred = estimator.predict(X_test)
-            y_probas = estimator.predict_proba(X_test)
+        # Each fold is fitted on its own estimator clone
+        fold_predictions = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_predict_fold)(
+                clone(estimator), X, y, train_idx, test_idx, self.predict_params, sample_idx
+            )
+            for train_idx, test_idx in folds
+        )
 
-            y_true_all.append(y_test)
-            y_pred_all.append(y_pred)
-            y_probas_all.append(y_probas)
-        
+        # Out of fold predictions are written in the original sample order
+        n_samples = len(y)
+        classes = np.unique(y)
+        y_pred = np.empty(
+            n_samples,
+            dtype=np.result_type(*[fold_pred.dtype for fold_pred, _, _ in fold_predictions])
+        )
+        y_probas = np.zeros((n_samples, len(classes)))
+        predicted = np.zeros(n_samples, dtype=bool)
+
+        for (_, test_idx), (fold_pred, fold_probas, fold_classes) in zip(folds, fold_predictions):
+            y_pred[test_idx] = fold_pred
+            # Classes missing in a fold train split have no probability column
+            y_probas[np.ix_(test_idx, np.searchsorted(classes, fold_classes))] = fold_probas
+            predicted[test_idx] = True
+
+        oof_index = np.flatnonzero(predicted)
+        if len(oof_index) == n_samples:
+            return [y, y_pred, y_probas, classes, oof_index]
+
+        # Splitters that do not test every sample only return the predicted ones
         return [
-            np.concatenate(y_true_all),
-            np.concatenate(y_pred_all),
-            np.concatenate(y_probas_all),
-            estimator.classes_
+            take(y, oof_index),
+            y_pred[oof_index],
+            y_probas[oof_index],
+            classes,
+            oof_index
         ]
     
-    def _run_simple(self, estimator, X, y):
+    def _run_simple(self, estimator, X, y, sample_idx=None):
 
-        y_pred = estimator.predict(X)
-        y_probas = estimator.predict_proba(X)
+        y_pred, y_probas = _predict(estimator, X, sample_idx=sample_idx, **self.predict_params)
 
         return [
             y,
@@ -113,3 +183,79 @@ class ModelPrediction():
             y_probas,
             estimator.classes_
         ]
+
+
+def _fit_predict_fold(estimator, X, y, train_idx, test_idx, predict_params, sample_idx=None):
+
+    # Fold indices are positions of the sample_idx rows of X
+    X_train_idx = train_idx if sample_idx is None else sample_idx[train_idx]
+    estimator.fit(take(X, X_train_idx), take(y, train_idx))
+
+    y_pred, y_probas = _predict(
+        estimator, X,
+        sample_idx=test_idx if sample_idx is None else sample_idx[test_idx],
+        **predict_params
+    )
+    return [y_pred, y_probas, estimator.classes_]
+
+
+def _predicts_argmax(estimator):
+    """ Whether y_pred can be derived from predict_proba without changing the predictions """
+
+    # Pipelines predict with their last step
+    if hasattr(estimator, 'steps'):
+        return _predicts_argmax(estimator.steps[-1][1])
+
+    estimator_class = type(estimator)
+    if not estimator_class.__module__.startswith('sklearn.'):
+        return False
+
+    if estimator_class.__name__ == 'SGDClassifier':
+        return getattr(estimator, 'loss', None) in ('log', 'log_loss')
+
+    return estimator_class.__name__ in ARGMAX_CLASSIFIERS
+
+
+# Predicts X in row chunks written into preallocated outputs. With single_pass,
+# predict_proba is run only once and y_pred is its most probable class, which is
+# what most classifiers predict (but not e.g. SVC, whose predict ignores the
+# Platt scaled probabilities). With single_pass 'auto' this is only done for
+# the estimators known to predict that class, the others also run predict.
+def _predict(estimator, X, chunk_size=None, n_jobs=None, single_pass='auto', sample_idx=None):
+
+    if single_pass == 'auto':
+        single_pass = _predicts_argmax(estimator)
+
+    if sample_idx is not None:
+        n_samples = len(sample_idx)
+    else:
+        n_samples = X.shape[0] if hasattr(X, 'shape') else len(X)
+    if chunk_size is None or chunk_size <= 0:
+        chunk_size = max(n_samples, 1)
+
+    y_probas = np.empty((n_samples, len(estimator.classes_)))
+    y_pred = None
+    if not single_pass:
+        y_pred = np.empty(n_samples, dtype=estimator.classes_.dtype)
+
+    def predict_chunk(start):
+        end = min(start + chunk_size, n_samples)
+        # Rows of sample_idx are only taken chunk by chunk
+        X_chunk = take(X, slice(start, end) if sample_idx is None else sample_idx[start:end])
+
+        y_probas[start:end] = estimator.predict_proba(X_chunk)
+        if y_pred is not None:
+            y_pred[start:end] = estimator.predict(X_chunk)
+
+    chunk_starts = range(0, n_samples, chunk_size)
+    if n_jobs is None or n_jobs == 1 or len(chunk_starts) <= 1:
+        for start in chunk_starts:
+            predict_chunk(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None) as executor:
+            list(executor.map(predict_chunk, chunk_starts))
+
+    if single_pass:
+        y_pred = estimator.classes_[np.argmax(y_probas, axis=1)]
+
+    return y_pred, y_probas
@@ -1,16 +1,39 @@
+import time
+import warnings
+from bisect import bisect_left
+from contextlib import nullcontext
+import numpy as np
 import pandas as pd
 
 from ConPipe.exceptions import NotExistentMethodError
+from ConPipe.executors import make_executor
+from ConPipe.shared_memory import SharedMemoryTransport, uses_shared_memory, load_shared, release_attached
 from ConPipe.Logger import Logger
 from ConPipe.ModuleLoader import get_class, get_function
-from sklearn.metrics import make_scorer
+from ConPipe.indexing import num_samples, take
+from joblib import Parallel, delayed
+from scipy.stats import rankdata
+from sklearn.base import clone
+from sklearn.metrics import make_scorer, check_scoring
+from sklearn.model_selection import ParameterGrid
+
+SEARCH_MODES = ('per_model', 'shared_pool', 'successive_halving')
 
 class ModelSelection():
 
-    def __init__(self, parameter_optimizer, scoring, cv, models):
+    def __init__(self, parameter_optimizer, scoring, cv, models, search_mode='per_model', search_parameters=None):
 
         self.logger = Logger()
 
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(
+                f'Search mode {search_mode} non existent, options are: '
+                + ', '.join(SEARCH_MODES)
+            )
+
+        self.search_mode = search_mode
+        self.search_parameters = search_parameters if search_parameters is not None else {}
+
         models = {
             model_name: model_params
             for model_name, model_params in models.items()
@@ -28,25 +51,42 @@ class ModelSelection():
             model_name: model_params['param_grid']
             for model_name, model_params in models.items()
         }
-        
+
+        # Fit cost of each model, used to dispatch the slowest fits first in the shared pool. Models
+        # without a given cost are measured with a probe fit (see _candidate_costs)
+        self.costs = {
+            model_name: float(model_params['cost'])
+            for model_name, model_params in models.items()
+            if model_params.get('cost', None) is not None
+        }
+
         # Note: Agregarlo como feature futura en GitHub
         # TODO: Implementar modelos encadenados con sklearn Pipe de forma de permitir cosas como hacer
         # feature selecton dentro del hiper parameter optimization schema
-        
+
         self.models = {
             model_name: get_class(model_params['class'])(
                 **model_params.get('constructor_params', {})
             ) for model_name, model_params in models.items()
         }
-        
+
         scoring_function = get_function(scoring['function'])
         if 'parameters' in scoring:
             scoring_function = make_scorer(
                 scoring_function,
                 **scoring.get('parameters', {})
             )
+        self.scoring_function = scoring_function
 
         cv_class = get_class(cv['class'])
+        self.cv = cv_class(**cv.get('parameters', {}))
+
+        optimizer_parameters = parameter_optimizer.get('parameters', {})
+        self.refit = optimizer_parameters.get('refit', True)
+        self.n_jobs = self.search_parameters.get(
+            'n_jobs',
+            optimizer_parameters.get('n_jobs', None)
+        )
 
         search_module = get_class(parameter_optimizer['class'])
         self.parameter_optimizers_ = {
@@ -56,7 +96,7 @@ class ModelSelection():
                 scoring=scoring_function,
                 cv=cv_class(**cv.get('parameters', {})),
                 verbose=self.logger.verbose,
-                **parameter_optimizer.get('parameters', {})
+                **optimizer_parameters
             ) for model_name, model in self.models.items()
         }
 
@@ -66,43 +106,462 @@ class ModelSelection():
         self.best_estimator_ = None
         self.best_score_ = None
         self.best_params_ = None
-    
-    def run(self, X, y=None, groups=None):
+
+    def run(self, X, y=None, groups=None, sample_idx=None):
         self.logger(1, f'Select best model and parameters')
 
-        self.cv_results_ = []
+        # With sample_idx, X, y and groups are the upstream arrays and only its sample_idx rows are used.
+        # sklearn search classes need their own copy, the other modes take the fold rows on demand.
+        if sample_idx is not None and self.search_mode == 'per_model':
+            X, y, groups = [
+                take(data, sample_idx) if data is not None else None
+                for data in (X, y, groups)
+            ]
+            sample_idx = None
+
+        if self.search_mode == 'shared_pool':
+            model_results = self._search_shared_pool(X, y, groups, sample_idx)
+        elif self.search_mode == 'successive_halving':
+            model_results = self._search_successive_halving(X, y, groups, sample_idx)
+        else:
+            model_results = self._search_per_model(X, y, groups)
+
+        self.cv_results_ = ModelSelection._merge_cv_results(model_results)
+
+        self.best_index_ = 0 
+        best_model = self.cv_results_.loc[self.best_index_,'model_name']
+
+        if self.search_mode == 'per_model':
+            self.best_optimizer_ = self.parameter_optimizers_[best_model]
+            self.best_estimator_ = self.best_optimizer_.best_estimator_
+            self.best_score_ = self.best_optimizer_.best_score_
+            self.best_params_ = self.best_optimizer_.best_params_
+        else:
+            self.best_optimizer_ = None
+            self._refit_best(best_model, model_results[best_model], X, y, sample_idx)
+
+        self.logger(1, f'Best model: {best_model}')
+        self.logger(1, f'Best parameters: {self.best_params_}')
+
+        return {
+            'estimator': self.best_estimator_,
+            'cv_results_': self.cv_results_
+        }
+
+    def _search_per_model(self, X, y, groups):
+
+        model_results = {}
         for model_name, optimizer in self.parameter_optimizers_.items(): 
             optimizer.fit(
                 X, y=y, groups=groups,
                 **self.fit_params[model_name]
             )
-            
-            self.cv_results_.append(pd.DataFrame(optimizer.cv_results_))
-            self.cv_results_[-1]['model_name'] = model_name
 
-        self.cv_results_ = pd.concat(self.cv_results_)
+            model_results[model_name] = pd.DataFrame(optimizer.cv_results_)
+
+        return model_results
+
+    def _search_shared_pool(self, X, y, groups, sample_idx=None):
+
+        candidates = self._candidates()
+        scores = self._evaluate_candidates(candidates, X, y, groups, sample_idx)
+
+        return self._format_model_results(candidates, scores)
+
+    def _search_successive_halving(self, X, y, groups, sample_idx=None):
+
+        factor = int(self.search_parameters.get('factor', 3))
+        max_fits = self.search_parameters.get('max_fits', None)
+        max_fits = int(max_fits) if max_fits is not None else None
+        time_budget = self.search_parameters.get('time_budget', None)
+        time_budget = float(time_budget) if time_budget is not None else None
+
+        candidates = self._candidates()
+        n_samples = num_samples(X) if sample_idx is None else len(sample_idx)
+        n_splits = self.cv.get_n_splits(X, y, groups)
+        min_resources = self._min_resources(
+            n_samples, len(candidates), n_splits, factor,
+            take(y, sample_idx) if y is not None and sample_idx is not None else y
+        )
+
+        # As in sklearn HalvingGridSearchCV, the iterations needed to end with a single candidate
+        # limited by the ones whose budget (min_resources * factor ** iteration) fits in the samples
+        n_required_iterations = 1 + int(np.floor(np.log(len(candidates)) / np.log(factor)))
+        n_possible_iterations = 1 + int(np.floor(np.log(n_samples // min_resources) / np.log(factor)))
+        n_iterations = min(n_required_iterations, n_possible_iterations)
+
+        # Samples of each iteration are the first n_resources of a fixed permutation, so subsets are nested
+        sample_order = np.random.RandomState(
+            self.search_parameters.get('random_state', None)
+        ).permutation(n_samples)
+
+        # Candidates keep the scores of the last iteration they reached
+        scores = np.full((len(candidates), n_splits, 3), np.nan)
+        iterations = np.zeros(len(candidates), dtype=int)
+        remaining = np.arange(len(candidates))
+
+        start_time = time.perf_counter()
+        n_fits = 0
+        for iteration in range(n_iterations):
+            n_resources = min(min_resources * factor ** iteration, n_samples)
+
+            if max_fits is not None and iteration > 0 and n_fits + len(remaining) * n_splits > max_fits:
+                self.logger(1, f'Fit budget of {max_fits} fits reached, stop the search at iteration {iteration}')
+                break
+
+            self.logger(1, f'Halving iteration {iteration}: {len(remaining)} candidates on {n_resources} samples')
+            samples = np.sort(sample_order[:n_resources])
+            iteration_candidates = [candidates[candidate_idx] for candidate_idx in remaining]
+
+            # After the first iteration the fit times measured in the previous one are the candidate costs
+            fit_times = scores[remaining, :, 1].mean(axis=1) if iteration > 0 else None
+            if sample_idx is None:
+                scores[remaining] = self._evaluate_candidates(
+                    iteration_candidates,
+                    take(X, samples),
+                    take(y, samples) if y is not None else None,
+                    np.asarray(groups)[samples] if groups is not None else None,
+                    fit_times=fit_times
+                )
+            else:
+                scores[remaining] = self._evaluate_candidates(
+                    iteration_candidates, X, y, groups, sample_idx[samples], fit_times
+                )
+            iterations[remaining] = iteration
+            n_fits += len(remaining) * n_splits
+
+            if iteration == n_iterations - 1:
+                break
+
+            if time_budget is not None and time.perf_counter() - start_time >= time_budget:
+                self.logger(1, f'Time budget of {time_budget} seconds reached, stop the search at iteration {iteration}')
+                break
+
+            # Only the top fraction of the candidates moves up to the next budget
+            mean_scores = np.nan_to_num(scores[remaining, :, 0].mean(axis=1), nan=-np.inf)
+            n_promoted = int(np.ceil(len(remaining) / factor))
+            remaining = remaining[np.argsort(-mean_scores, kind='stable')[:n_promoted]]
+
+            # A single survivor is already the best candidate, it is not evaluated again on more samples
+            if len(remaining) == 1:
+                break
+
+        # Candidates that reached later iterations rank above the ones discarded before
+        mean_scores = np.nan_to_num(scores[:, :, 0].mean(axis=1), nan=-np.inf)
+        keys = list(zip(-iterations, -mean_scores))
+        sorted_keys = sorted(keys)
+        ranks = np.array([bisect_left(sorted_keys, key) + 1 for key in keys], dtype=np.int32)
+
+        return self._format_model_results(candidates, scores, ranks)
+
+    def _min_resources(self, n_samples, n_candidates, n_splits, factor, y):
+
+        min_resources = self.search_parameters.get('min_resources', 'exhaust')
+        if isinstance(min_resources, float):
+            return max(1, min(n_samples, int(min_resources * n_samples)))
+
+        if min_resources != 'exhaust':
+            return min(n_samples, int(min_resources))
+
+        # Smallest budget that lets the last iteration use all the samples
+        n_iterations = 1 + int(np.floor(np.log(n_candidates) / np.log(factor)))
+        min_resources = n_samples // factor ** (n_iterations - 1)
+
+        # Every fold must have some samples of each class
+        n_classes = len(np.unique(np.asarray(y))) if y is not None else 1
+        return min(n_samples, max(min_resources, 2 * n_splits * n_classes))
+
+    def _candidates(self):
+        return [
+            (model_name, parameters)
+            for model_name in self.models.keys()
+            for parameters in ParameterGrid(self.param_grids[model_name])
+        ]
+
+    # Runs the cross validation of every (model_name, parameters) candidate in
+    # the shared pool and returns its (score, fit_time, score_time) per fold
+    def _evaluate_candidates(self, candidates, X, y, groups, sample_idx=None, fit_times=None):
+
+        if sample_idx is None:
+            folds = list(self.cv.split(X, y, groups))
+        else:
+            # Folds of the sample_idx rows, mapped to rows of the upstream arrays
+            folds = [
+                (sample_idx[train], sample_idx[test])
+                for train, test in self.cv.split(
+                    np.empty((len(sample_idx), 0)),
+                    take(y, sample_idx) if y is not None else None,
+                    np.asarray(groups)[sample_idx] if groups is not None else None
+                )
+            ]
+
+        # Flatten every (candidate, fold) fit in a single job list, slowest candidates first
+        costs = self._candidate_costs(candidates, X, y, sample_idx, fit_times)
+        jobs = sorted(
+            [
+                (candidate_idx, fold_idx)
+                for candidate_idx in range(len(candidates))
+                for fold_idx in range(len(folds))
+            ],
+            key=lambda job: -costs[job[0]]
+        )
+
+        self.logger(1, f'Fitting {len(folds)} folds for {len(candidates)} candidates, '
+                       f'totalling {len(jobs)} fits')
+
+        outputs = self._run_fit_jobs([
+            (
+                self.models[candidates[candidate_idx][0]],
+                candidates[candidate_idx][1],
+                folds[fold_idx][0],
+                folds[fold_idx][1],
+                self.fit_params[candidates[candidate_idx][0]]
+            )
+            for candidate_idx, fold_idx in jobs
+        ], X, y)
+
+        scores = np.empty((len(candidates), len(folds), 3))
+        for (candidate_idx, fold_idx), output in zip(jobs, outputs):
+            scores[candidate_idx, fold_idx] = output
 
-        self.cv_results_.sort_values(
+        return scores
+
+    def _candidate_costs(self, candidates, X, y, sample_idx=None, fit_times=None):
+        """ Expected fit time of each candidate: its given fit_times, otherwise the time of a probe
+        fit of the first candidate of its model on probe_size samples. The cost of a model in its
+        config overrides both.
+        """
+
+        costs = np.ones(len(candidates)) if fit_times is None else np.nan_to_num(np.asarray(fit_times, dtype=float))
+
+        model_names = list(dict.fromkeys(model_name for model_name, _ in candidates))
+        probe_models = [model_name for model_name in model_names if model_name not in self.costs]
+        if fit_times is None and len(model_names) > 1 and len(probe_models) > 0:
+            probe_costs = self._probe_costs(
+                [next(candidate for candidate in candidates if candidate[0] == model_name) for model_name in probe_models],
+                X, y, sample_idx
+            )
+            costs = np.array([probe_costs.get(model_name, 1.0) for model_name, _ in candidates])
+
+        for candidate_idx, (model_name, _) in enumerate(candidates):
+            if model_name in self.costs:
+                costs[candidate_idx] = self.costs[model_name]
+
+        return costs
+
+    def _probe_costs(self, candidates, X, y, sample_idx=None):
+
+        rows = np.arange(num_samples(X)) if sample_idx is None else np.asarray(sample_idx)
+        probe_size = self.search_parameters.get('probe_size', 500)
+        if isinstance(probe_size, float):
+            probe_size = int(probe_size * len(rows))
+        probe_size = min(int(probe_size), len(rows))
+        if probe_size <= 0:
+            return {}
+
+        rows = np.sort(np.random.RandomState(
+            self.search_parameters.get('random_state', None)
+        ).permutation(rows)[:probe_size])
+        X_probe = take(X, rows)
+        y_probe = take(y, rows) if y is not None else None
+
+        probe_costs = {}
+        for model_name, parameters in candidates:
+            estimator = clone(self.models[model_name]).set_params(**parameters)
+            start_time = time.perf_counter()
+            try:
+                estimator.fit(X_probe, y_probe)
+            except Exception as error:
+                self.logger(4, f'Probe fit of {model_name} failed, its cost is unknown: {error}', 1)
+                continue
+            probe_costs[model_name] = time.perf_counter() - start_time
+            self.logger(4, f'Probe fit of {model_name} took {probe_costs[model_name]:.4f} seconds', 1)
+
+        # Models whose probe failed go first, as the slowest measured one
+        if len(probe_costs) > 0:
+            slowest = max(probe_costs.values())
+            probe_costs.update({
+                model_name: slowest
+                for model_name, _ in candidates
+                if model_name not in probe_costs
+            })
+
+        return probe_costs
+
+    def _format_model_results(self, candidates, scores, ranks=None):
+
+        model_results = {}
+        for model_name in self.models.keys():
+            model_idx = [
+                candidate_idx
+                for candidate_idx, (candidate_model, _) in enumerate(candidates)
+                if candidate_model == model_name
+            ]
+
+            model_results[model_name] = ModelSelection._format_cv_results(
+                [candidates[candidate_idx][1] for candidate_idx in model_idx],
+                scores[model_idx],
+                ranks[model_idx] if ranks is not None else None
+            )
+
+        return model_results
+
+    # Sets the best candidate of a model as sklearn search classes do with refit
+    def _refit_best(self, model_name, results, X, y, sample_idx=None):
+
+        best_idx = int(np.argmin(results['rank_test_score']))
+        self.best_params_ = results['params'][best_idx]
+        self.best_score_ = results['mean_test_score'][best_idx]
+
+        self.best_estimator_ = None
+        if self.refit:
+            if sample_idx is not None:
+                X = take(X, sample_idx)
+                y = take(y, sample_idx) if y is not None else None
+
+            self.best_estimator_ = clone(self.models[model_name]).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y, **self.fit_params[model_name])
+
+    # Runs the fit jobs (estimator, parameters, train, test, fit_params) and
+    # returns the (score, fit_time, score_time) of each one in the same order
+    def _run_fit_jobs(self, jobs, X, y):
+
+        # Fits can also run on an execution backend (e.g. workers on other machines)
+        backend = self.search_parameters.get('backend', None)
+        if backend is not None:
+            return self._run_backend_fit_jobs(backend, jobs, X, y)
+
+        return Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_and_score)(
+                estimator, X, y, train, test, parameters, self.scoring_function, fit_params
+            )
+            for estimator, parameters, train, test, fit_params in jobs
+        )
+
+    def _run_backend_fit_jobs(self, backend, jobs, X, y):
+
+        # X and y are sent with every task, so several fits can be grouped in a task
+        jobs_per_task = int(backend.get('jobs_per_task', 1))
+
+        # With shared memory the tasks only carry handles to X and y
+        transport = SharedMemoryTransport() if uses_shared_memory(backend) else nullcontext()
+        with transport, make_executor(backend) as executor:
+            if isinstance(transport, SharedMemoryTransport):
+                X = transport.share(X, 'fit_jobs')
+                y = transport.share(y, 'fit_jobs')
+
+            futures = [
+                executor.submit(
+                    _fit_and_score_jobs,
+                    jobs[start:start + jobs_per_task],
+                    X, y,
+                    self.scoring_function
+                )
+                for start in range(0, len(jobs), jobs_per_task)
+            ]
+
+            return [output for future in futures for output in future.result()]
+
+    # Builds the cv_results_ of a model in the same format as sklearn search classes
+    @staticmethod
+    def _format_cv_results(candidates, scores, ranks=None):
+
+        fit_times = scores[:, :, 1]
+        score_times = scores[:, :, 2]
+        test_scores = scores[:, :, 0]
+
+        results = {
+            'mean_fit_time': fit_times.mean(axis=1),
+            'std_fit_time': fit_times.std(axis=1),
+            'mean_score_time': score_times.mean(axis=1),
+            'std_score_time': score_times.std(axis=1)
+        }
+
+        param_names = sorted({name for params in candidates for name in params.keys()})
+        for name in param_names:
+            results[f'param_{name}'] = [params.get(name, np.nan) for params in candidates]
+
+        results['params'] = candidates
+
+        for fold_idx in range(test_scores.shape[1]):
+            results[f'split{fold_idx}_test_score'] = test_scores[:, fold_idx]
+
+        mean_scores = test_scores.mean(axis=1)
+        results['mean_test_score'] = mean_scores
+        results['std_test_score'] = test_scores.std(axis=1)
+
+        # Failed fits have NaN scores and are ranked as tied with the worst candidates
+        if ranks is not None:
+            results['rank_test_score'] = ranks
+        elif np.isnan(mean_scores).all():
+            results['rank_test_score'] = np.ones_like(mean_scores, dtype=np.int32)
+        else:
+            mean_scores = np.nan_to_num(mean_scores, nan=np.nanmin(mean_scores) - 1)
+            results['rank_test_score'] = rankdata(-mean_scores, method='min').astype(np.int32)
+
+        return pd.DataFrame(results)
+
+    @staticmethod
+    def _merge_cv_results(model_results):
+
+        cv_results = []
+        for model_name, results in model_results.items():
+            cv_results.append(results)
+            cv_results[-1]['model_name'] = model_name
+
+        cv_results = pd.concat(cv_results)
+
+        cv_results.sort_values(
             by='rank_test_score',
             axis=0,
             inplace=True,
             ignore_index=True
         )
 
-        self.cv_results_.loc[:, 'rank_test_score'] = self.cv_results_.index + 1
+        cv_results.loc[:, 'rank_test_score'] = cv_results.index + 1
 
+        return cv_results
 
-        self.best_index_ = 0 
-        best_model = self.cv_results_.loc[self.best_index_,'model_name']
-        self.best_optimizer_ = self.parameter_optimizers_[best_model]
-        self.best_estimator_ = self.best_optimizer_.best_estimator_
-        self.best_score_ = self.best_optimizer_.best_score_
-        self.best_params_ = self.best_optimizer_.best_params_
 
-        self.logger(1, f'Best model: {best_model}')
-        self.logger(1, f'Best parameters: {self.best_params_}')
+def _fit_and_score_jobs(jobs, X, y, scorer):
 
-        return {
-            'estimator': self.best_estimator_,
-            'cv_results_': self.cv_results_
-        }
+    X = load_shared(X)
+    y = load_shared(y)
+    outputs = [
+        _fit_and_score(estimator, X, y, train, test, parameters, scorer, fit_params)
+        for estimator, parameters, train, test, fit_params in jobs
+    ]
+
+    del X, y
+    release_attached()
+
+    return outputs
+
+
+def _fit_and_score(estimator, X, y, train, test, parameters, scorer, fit_params):
+
+    n_samples = len(y) if y is not None else X.shape[0]
+
+    # Sample aligned fit params (e.g. sample_weight) are restricted to the train samples
+    fit_params = {
+        name: take(np.asarray(value), train) if hasattr(value, '__len__') and len(value) == n_samples else value
+        for name, value in fit_params.items()
+    }
+
+    estimator = clone(estimator).set_params(**parameters)
+    y_train = take(y, train) if y is not None else None
+    y_test = take(y, test) if y is not None else None
+
+    start_time = time.perf_counter()
+    try:
+        estimator.fit(take(X, train), y_train, **fit_params)
+    except Exception as error:
+        warnings.warn(f'Fit failed with parameters {parameters}, its score is set to NaN: {error}')
+        return np.nan, time.perf_counter() - start_time, 0.0
+    fit_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    score = check_scoring(estimator, scoring=scorer)(estimator, take(X, test), y_test)
+    score_time = time.perf_counter() - start_time
+
+    return score, fit_time, score_time
@@ -1,15 +1,31 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
+import matplotlib
+import hashlib
+import inspect
+import json
 import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from pathlib import Path
 
+from ConPipe.exceptions import NotSharedMetricError
+from ConPipe.executors import init_worker, process_context
 from ConPipe.Logger import Logger
-from ConPipe.ModuleLoader import get_function
+from ConPipe.ModuleLoader import get_function, get_object_fingerprint
+from ConPipe.metrics import ConfusionStats, get_shared_metric
+from ConPipe.shared_memory import SharedMemoryTransport, load_shared, release_attached
 
+# pyplot keeps a global figure state, charts of nodes running in threads must not interleave
+_pyplot_lock = threading.Lock()
 
 class ResultEvaluation():
 
-    def __init__(self, scores, charts, output_path, tag, classes=None, class_labels=None):
+    def __init__(self, scores, charts, output_path, tag, classes=None, class_labels=None,
+                 chart_n_jobs=None, skip_unchanged_charts=False):
 
         # TODO: Check if all the mandatory parameters are set and correct or raise Value error
 
@@ -17,6 +33,8 @@ class ResultEvaluation():
         self.tag = tag
         self.classes = classes
         self.class_labels = class_labels
+        self.chart_n_jobs = int(chart_n_jobs) if chart_n_jobs is not None else None
+        self.skip_unchanged_charts = skip_unchanged_charts
         self.logger = Logger()
 
         Path(self.output_path).mkdir(
@@ -26,6 +44,7 @@ class ResultEvaluation():
 
         # Get all al score functions ready to run
         self.score_pred_functions = {}
+        self.score_shared_functions = {}
         self.score_proba_functions = {}
         self.score_parameters = {}
         for score_name, score_module in scores.items():
@@ -34,6 +53,11 @@ class ResultEvaluation():
             
             if score_module['score_type'] == 'pred':
                 self.score_pred_functions[score_name] = func
+
+                # Scores that can be derived from the shared confusion matrix
+                shared_func = get_shared_metric(func)
+                if shared_func is not None:
+                    self.score_shared_functions[score_name] = shared_func
             elif score_module['score_type'] == 'proba':
                 self.score_proba_functions[score_name] = func
 
@@ -70,37 +94,111 @@ class ResultEvaluation():
         self._calculate_scores(y_true, y_pred, y_probas)
 
     def _make_charts(self, y_true, y_pred, y_probas, classes, class_labels):
+
+        # Charts get read only views instead of their own copy of the predictions
+        chart_data = {
+            'y_true': _read_only(y_true),
+            'y_pred': _read_only(y_pred),
+            'y_probas': _read_only(y_probas),
+            'classes': classes,
+            'class_labels': class_labels
+        }
+
+        fingerprints_file = os.path.join(self.output_path, f'{self.tag}_charts.json')
+        chart_data_file = os.path.join(self.output_path, f'{self.tag}_chart_data.json')
+        fingerprints = {}
+        previous_data = {}
+        if self.skip_unchanged_charts:
+            data_fingerprint = _data_fingerprint(chart_data)
+            if os.path.exists(fingerprints_file):
+                with open(fingerprints_file, 'r', encoding='utf-8') as file:
+                    fingerprints = json.load(file)
+            if os.path.exists(chart_data_file):
+                with open(chart_data_file, 'r', encoding='utf-8') as file:
+                    previous_data = json.load(file)
+
+        # Data returned by the chart functions (e.g. the AUC of the ROC charts)
+        self.chart_data_ = {}
+
+        charts = {}
         for chart_name, chart_function in self.chart_functions.items():
-            self.logger(2, f'making chart {chart_name}')
-            plt.clf()
-            chart_function(
-                y_true=y_true.copy(),
-                y_pred=y_pred.copy(),
-                y_probas=y_probas.copy(),
-                classes=classes,
-                class_labels=class_labels,
-                **self.chart_parameters[chart_name]
-            )
-
-            plt.savefig(
-                os.path.join(
-                    self.output_path,
-                    f'{self.tag}_{chart_name}.png'
-                )
-            )
+            output_file = os.path.join(self.output_path, f'{self.tag}_{chart_name}.png')
+
+            if self.skip_unchanged_charts:
+                fingerprint = hashlib.sha256(
+                    (data_fingerprint + get_object_fingerprint(chart_function) +
+                     json.dumps(self.chart_parameters[chart_name], sort_keys=True, default=str)).encode('utf-8')
+                ).hexdigest()
+
+                if fingerprints.get(chart_name, None) == fingerprint and os.path.exists(output_file):
+                    self.logger(2, f'chart {chart_name} unchanged, skipping it')
+                    if chart_name in previous_data:
+                        self.chart_data_[chart_name] = previous_data[chart_name]
+                    continue
+
+                fingerprints[chart_name] = fingerprint
+
+            charts[chart_name] = (chart_function, output_file, self.chart_parameters[chart_name])
+
+        results = {}
+        if self.chart_n_jobs is None or self.chart_n_jobs == 1 or len(charts) <= 1:
+            for chart_name, (chart_function, output_file, parameters) in charts.items():
+                self.logger(2, f'making chart {chart_name}')
+                results[chart_name] = _render_chart(chart_function, output_file, {**chart_data, **parameters})
+        else:
+            self.logger(2, f'making charts {", ".join(charts.keys())}')
+
+            # The predictions are placed once in shared memory, chart tasks only carry a handle to them
+            with SharedMemoryTransport() as transport, ProcessPoolExecutor(
+                max_workers=self.chart_n_jobs if self.chart_n_jobs > 0 else None,
+                mp_context=process_context(),
+                initializer=_init_chart_worker,
+                initargs=(list(sys.path), self.logger.verbose)
+            ) as executor:
+                shared_data = transport.share(chart_data, 'charts')
+                futures = {
+                    chart_name: executor.submit(_render_shared_chart, chart_function, output_file, shared_data, parameters)
+                    for chart_name, (chart_function, output_file, parameters) in charts.items()
+                }
+                for chart_name, future in futures.items():
+                    results[chart_name] = future.result()
+
+        for chart_name, result in results.items():
+            if result is not None:
+                self.chart_data_[chart_name] = result
+
+        if len(self.chart_data_) > 0:
+            self.logger(1, 'Obtained chart data:')
+            self.logger(1, self.chart_data_)
+            with open(chart_data_file, 'w', encoding='utf-8') as file:
+                json.dump(self.chart_data_, file, indent=2, default=float)
+
+        if self.skip_unchanged_charts:
+            with open(fingerprints_file, 'w', encoding='utf-8') as file:
+                json.dump(fingerprints, file, indent=2)
 
     def _calculate_scores(self, y_true, y_pred, y_probas):
-        
+
+        # Label encoding and confusion matrix are computed once for all the shared scores
+        stats = None
+        if len(self.score_shared_functions) > 0:
+            try:
+                stats = ConfusionStats(y_true, y_pred)
+            except NotSharedMetricError as error:
+                self.logger(3, f'Shared scores disabled: {error}')
+
         scores = []
         # Calculate scores with y_pred
         for score_name, score_function in self.score_pred_functions.items():
             self.logger(2, f'Calculating score {score_name}')
             scores.append({
                 'score_name': score_name,
-                'score_val': score_function(
+                'score_val': self._calculate_pred_score(
+                    score_name,
+                    score_function,
+                    stats,
                     y_true,
-                    y_pred,
-                    **self.score_parameters[score_name]
+                    y_pred
                 )
             })
         
@@ -124,4 +222,69 @@ class ResultEvaluation():
             sep=';',
             index=False
         )
-        
+
+    def _calculate_pred_score(self, score_name, score_function, stats, y_true, y_pred):
+
+        if stats is not None and score_name in self.score_shared_functions:
+            try:
+                return self.score_shared_functions[score_name](
+                    stats,
+                    **self.score_parameters[score_name]
+                )
+            except NotSharedMetricError as error:
+                self.logger(3, f'Score {score_name} calculated with {score_function.__name__}: {error}')
+
+        return score_function(
+            y_true,
+            y_pred,
+            **self.score_parameters[score_name]
+        )
+
+
+def _read_only(array):
+    array = np.asarray(array).view()
+    array.flags.writeable = False
+    return array
+
+
+def _data_fingerprint(chart_data):
+    hasher = hashlib.sha256()
+    for name, value in chart_data.items():
+        value = np.asarray(value)
+        hasher.update(f'{name}:{value.dtype}:{value.shape}'.encode('utf-8'))
+        if value.dtype.hasobject:
+            hasher.update(repr(value.tolist()).encode('utf-8'))
+        else:
+            hasher.update(np.ascontiguousarray(value).data)
+    return hasher.hexdigest()
+
+
+# Chart worker processes never open windows
+def _init_chart_worker(paths, verbose):
+    init_worker(paths, verbose)
+    matplotlib.use('Agg')
+
+
+def _render_shared_chart(chart_function, output_file, shared_data, parameters):
+
+    result = _render_chart(chart_function, output_file, {**load_shared(shared_data), **parameters})
+    release_attached()
+    return result
+
+
+def _render_chart(chart_function, output_file, chart_kwargs):
+
+    # Charts that accept an axis are drawn on their own figure, independent from pyplot
+    if 'ax' in inspect.signature(chart_function).parameters:
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        result = chart_function(ax=figure.add_subplot(), **chart_kwargs)
+        figure.savefig(output_file)
+        return result
+
+    import matplotlib.pyplot as plt
+    with _pyplot_lock:
+        plt.clf()
+        result = chart_function(**chart_kwargs)
+        plt.savefig(output_file)
+        return result
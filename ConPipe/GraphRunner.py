@@ -1,18 +1,40 @@
 from pathlib import Path
 from graph import Graph
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
 import hiyapyco
 import json
 import os
 import copy
-import pickle
-import numpy as np
-import glob
-import pandas as pd
+import hashlib
+import threading
+import time
 
 from ConPipe.FunctionModule import FunctionModule
-from ConPipe.ModuleLoader import add_path_to_modules, get_class, get_function
+from ConPipe.executors import make_executor
+from ConPipe.LazyModule import LazyModule
+from ConPipe.LazyOutput import LazyOutput
+from ConPipe.ModuleLoader import add_path_to_modules, get_module_fingerprint, get_object_fingerprint
 from ConPipe.Logger import Logger
+from ConPipe.profiling import run_profiled, profile_report, profile_table
+from ConPipe.shared_memory import SharedMemoryTransport, uses_shared_memory, load_shared, export_value, \
+    release_attached
+from ConPipe.StreamOutput import StreamOutput, DEFAULT_QUEUE_SIZE, stream_value, close_readers
+from ConPipe.storage import output_file_name, save_value, load_value, \
+    reload_after_save, manifest_entry, write_manifest, read_manifest, write_json, directory_lock
+
+# Node configurations that do not change the node outputs and are thus left out of the cache keys
+# (the columns of output_storage_options are part of the keys of the nodes that load them)
+CACHE_KEY_IGNORED_CONFIGS = (
+    'cache_output',
+    'force_not_rerun',
+    'output_storage_type',
+    'output_storage_options',
+    'pin_output',
+    'profile',
+    'stream_queue_size'
+)
 
 
 class GraphRunner():
@@ -39,6 +61,7 @@ class GraphRunner():
 
         self.logger = Logger(general_config.get('verbose', 1))
         self.pandas_sep = general_config.get('pandas_sep', ';')
+        self.verify_checksums = general_config.get('verify_checksums', False)
         self.root_path = str(Path(config_paths[0]).parent.resolve())
 
         # Calculate save path where to store the nodes outputs and pipeline state
@@ -61,12 +84,22 @@ class GraphRunner():
             self.logger
         )
 
+        # Bounded thread pool where cached output files are read, only alive while loading the
+        # graph and during run, so runners that are not used anymore do not keep its threads
+        io_workers = general_config.get('io_workers', None)
+        self.io_workers = int(io_workers) if io_workers is not None else None
+        self.io_executor_ = None
+
+        self.consumers_ = None
+        self._release_lock = threading.Lock()
+        self.streams_ = []
         self._load_graph()
     
     def _load_graph(self):
 
         self.logger(3, 'Create all DAG nodes')
         self.graph_ = Graph()
+        lazy_modules = self.config.get('general', {}).get('lazy_modules', True)
 
         for name, config in self.config.items():
             if name == 'general':
@@ -80,19 +113,17 @@ class GraphRunner():
                     function=GraphRunner._bypass_node,
                     parameters=config
                 )
+                code_fingerprint = get_object_fingerprint(GraphRunner._bypass_node)
 
             elif 'class' in config:
                 self.logger(4, f'Add class node {name} to the execution graph')
-                module = get_class(config['class'])(
-                    **config.get('parameters', {})
-                )
+                module = LazyModule(config)
+                code_fingerprint = get_module_fingerprint(config['class'])
 
             elif 'function' in config:
                 self.logger(4, f'Add function node {name} to the execution graph')
-                module = FunctionModule(
-                    function=get_function(config['function']),
-                    parameters=config.get('parameters', {})
-                )
+                module = LazyModule(config)
+                code_fingerprint = get_module_fingerprint(config['function'])
 
             else:
                 raise AttributeError(
@@ -100,11 +131,27 @@ class GraphRunner():
                     'or the module must be set to bypass = True'
                 )
 
+            # Modules are imported and built on their first run unless lazy_modules is Off
+            if isinstance(module, LazyModule) and not lazy_modules:
+                module.module()
+
+            # A null sender removes all the inputs (and the dependency) inherited from the base module
+            if config.get('input_map', None) is not None:
+                config = {
+                    **config,
+                    'input_map': {
+                        sender_node: input_map
+                        for sender_node, input_map in config['input_map'].items()
+                        if input_map is not None
+                    }
+                }
+
             self.graph_.add_node(
                 name, 
                 {
                     **config,
                     'module': module,
+                    'code_fingerprint': code_fingerprint,
                     'name': name,
                     'output': None
                 }
@@ -122,8 +169,16 @@ class GraphRunner():
             for input_node in node.get('input_map',{}).keys():
                 self.logger(6, f'add input/output dependency {input_node} to node {node_name}', 1)
                 self.graph_.add_edge(input_node, node_name)
+
+            for stream_node in node.get('stream_inputs', []):
+                if stream_node not in node.get('input_map', {}):
+                    raise ValueError(
+                        f'Stream input {stream_node} of node {node_name} non existent, options are:'
+                        f'\n\t' + '\n\t'.join(node.get('input_map', {}).keys())
+                    )
         
         self._load_nodes_state()
+        self._compute_cache_keys()
         self._load_nodes_output()
 
     def _load_nodes_state(self):
@@ -131,67 +186,157 @@ class GraphRunner():
         self.logger(2, 'Load node run state')
         for node_name in self.graph_.nodes():
             node = self.graph_.node(node_name)
-            run_state_file = os.path.join(
-                self.save_dir, 
-                node['name'],
-                f'run_state.json'
-            )
+            run_state_file = self._run_state_path(node['name'])
             if os.path.exists(run_state_file):
                 with open(run_state_file, 'r', encoding='utf-8') as file:
                     node['run_state'] = json.load(file)
                     node['run_state']['last_run'] = datetime.fromisoformat(node['run_state']['last_run'])
+                    node['run_state'].setdefault('cache_key', None)
+                    node['run_state'].setdefault('profile', {})
             else:
-                node['run_state'] = {'last_run': None}
+                node['run_state'] = {'last_run': None, 'cache_key': None, 'profile': {}}
+
+    def _compute_cache_keys(self):
+
+        self.logger(3, 'Compute node cache keys')
+        for node_name in self.graph_.topological_sort():
+            node = self.graph_.node(node_name)
+
+            stored_key = node['run_state']['cache_key']
+            if node.get('force_not_rerun', False) and stored_key is not None:
+                # Forced nodes are never recalculated, so descendants depend on the stored results
+                node['cache_key'] = stored_key
+                continue
+
+            config = {
+                key: value
+                for key, value in self.config[node_name].items()
+                if key not in CACHE_KEY_IGNORED_CONFIGS
+            }
+
+            hasher = hashlib.sha256()
+            hasher.update(json.dumps(
+                GraphRunner._canonical_config(config),
+                sort_keys=True,
+                default=str
+            ).encode('utf-8'))
+            hasher.update(node['code_fingerprint'].encode('utf-8'))
+            for predecessor in sorted(self.graph_.nodes(to_node=node_name)):
+                predecessor_key = self.graph_.node(predecessor)['cache_key']
+                hasher.update(f'{predecessor}:{predecessor_key}'.encode('utf-8'))
+
+                # The columns loaded from the predecessor outputs change this node inputs (not the
+                # predecessor outputs on disk), so they are part of this key and not of the predecessor one
+                predecessor_columns = GraphRunner._loaded_columns(self.config.get(predecessor, {}))
+                if len(predecessor_columns) > 0:
+                    hasher.update(json.dumps(predecessor_columns, sort_keys=True, default=str).encode('utf-8'))
+
+            node['cache_key'] = hasher.hexdigest()
+            self.logger(6, f'Node {node_name} cache key {node["cache_key"]}', 1)
+
+    @staticmethod
+    def _loaded_columns(config):
+        storage_options = config.get('output_storage_options', None) or {}
+        return {
+            output_name: options['columns']
+            for output_name, options in storage_options.items()
+            if isinstance(options, dict) and options.get('columns', None) is not None
+        }
+
+    def _run_state_path(self, node_name):
+        return os.path.join(self.save_dir, node_name, 'run_state.json')
 
     def _load_nodes_output(self):
 
         self.logger(2, 'Load node cached outputs')
 
+        cached_nodes = []
         for node_name in self.graph_.nodes():
             node = self.graph_.node(node_name)
-            output_dir = os.path.join(self.save_dir, node['name'], 'output')
+            output_dir = self._output_dir(node['name'])
             if not node.get('cache_output', True):
                 self.logger(4, f'Node {node_name} cache output set to False', 1)
-            
-            elif os.path.isdir(output_dir):    
-                self.logger(4, f'Load node {node_name} cached outputs', 1)
-                node['output'] = {}
-                for file in glob.glob(os.path.join(output_dir, '*.json')):
 
-                    if file.split('/')[-1] == 'run_state.json':
-                        continue
+            elif os.path.isdir(output_dir) and node['run_state']['cache_key'] == node['cache_key']:
+                self.logger(4, f'Index node {node_name} cached outputs', 1)
+                cached_nodes.append((node, output_dir))
 
-                    output_name = file.split('/')[-1].replace('.json', '')
-                    self.logger(6, f'Load {node_name}.{output_name}.json output', 2)
-                    with open(file, 'r', encoding='utf-8') as json_file:
-                        node['output'][output_name] = json.load(json_file)
-                
-                for file in glob.glob(os.path.join(output_dir, '*.npy')):
-                    output_name = file.split('/')[-1].replace('.npy', '')
-                    self.logger(6, f'Load {node_name}.{output_name}.npy output', 2)
-                    node['output'][output_name] = np.load(file)
-                
-                for file in glob.glob(os.path.join(output_dir, '*.csv')):
-                    output_name = file.split('/')[-1].replace('.csv', '')
-                    self.logger(6, f'Load {node_name}.{output_name}.csv output', 2)
-                    node['output'][output_name] = pd.read_csv(
-                        file,
-                        sep=self.pandas_sep,
-                        encoding='utf-8'
-                    )
-                
-                for file in glob.glob(os.path.join(output_dir, '*.pickle')):
-                    output_name = file.split('/')[-1].replace('.pickle', '')
-                    self.logger(6, f'Load {node_name}.{output_name}.pickle output', 2)
-                    with open(file, 'rb') as pickle_file:
-                        node['output'][output_name] = pickle.load(pickle_file)
+            elif self._external_output_dir(node) is not None:
+                self.logger(4, f'Index node {node_name} cached outputs from {node["cache_path"]}', 1)
+                cached_nodes.append((node, self._external_output_dir(node)))
+
+            elif not os.path.isdir(output_dir):
+                self.logger(4, f'Node {node_name} has no cached outputs', 1)
+
+            else:
+                self.logger(2, f'Node {node_name} config, code or inputs changed, cached outputs discarded', 1)
+
+        with self._io_executor() as io_executor:
+            # Manifests are read concurrently, each one with a single file read or directory scan
+            manifests = io_executor.map(
+                read_manifest,
+                [output_dir for _, output_dir in cached_nodes]
+            )
+            for (node, output_dir), manifest in zip(cached_nodes, manifests):
+                node['output'] = self._lazy_output(node, manifest, output_dir)
+
+            if self.config.get('general', {}).get('eager_hydration', False):
+                self.logger(2, 'Load all the cached outputs')
+                start_time = time.perf_counter()
+                self._wait_loads([
+                    future
+                    for node, _ in cached_nodes
+                    for future in node['output'].prefetch(io_executor)
+                ])
+                self.logger(2, f'Cached outputs loaded in {time.perf_counter() - start_time:.3f} seconds')
+
+    def _io_executor(self):
+        return ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='ConPipe-io')
+
+    def _wait_loads(self, futures):
+        for future in futures:
+            future.result()
+
+    def _output_dir(self, node_name):
+        return os.path.join(self.save_dir, node_name, 'output')
+
+    # Output directory of a cache of the node with the same cache key in the read only general.cache_paths
+    def _external_output_dir(self, node):
+
+        for cache_path in self.config.get('general', {}).get('cache_paths', []):
+            if not os.path.isabs(cache_path):
+                cache_path = os.path.join(self.root_path, cache_path)
+
+            run_state_file = os.path.join(cache_path, node['name'], 'run_state.json')
+            output_dir = os.path.join(cache_path, node['name'], 'output')
+            if not os.path.exists(run_state_file) or not os.path.isdir(output_dir):
+                continue
+
+            with open(run_state_file, 'r', encoding='utf-8') as file:
+                if json.load(file).get('cache_key', None) == node['cache_key']:
+                    node['cache_path'] = cache_path
+                    return output_dir
+
+        return None
+
+    def _lazy_output(self, node, manifest, output_dir=None):
+        return LazyOutput(
+            output_dir if output_dir is not None else self._output_dir(node['name']),
+            manifest,
+            self.pandas_sep,
+            node.get('output_storage_options', {}),
+            self.verify_checksums
+        )
+
+    def _profile_path(self, node_name):
+        return os.path.join(self.save_dir, node_name, 'profile.prof')
 
     def _save_output(self, node):
 
         self.logger(2, f'Saving {node["name"]} output')
 
         # Create the node folder where to store output
-        output_dir = os.path.join(self.save_dir, node['name'], 'output')
+        output_dir = self._output_dir(node['name'])
         Path(output_dir).mkdir(
             parents=True, 
             exist_ok=True
@@ -201,88 +346,512 @@ class GraphRunner():
 
         output_types = node['output_storage_type']
 
-        if type(output_types) == str:
+        if isinstance(output_types, str):
             output_types = {
                 output_name: output_types
                 for output_name in node['output'].keys()
             }
 
+        storage_options = node.get('output_storage_options', {})
+
+        manifest = {}
+        node['output_stats'] = {}
         for output_name, output_val in node['output'].items():
-            
-            if output_types[output_name] == 'json':
-                output_file = os.path.join(output_dir, f'{output_name}.json')
-                self.logger(4, f'Saving output {output_name} to {output_file}')
-                with open(output_file, 'w', encoding='utf-8') as json_file:
-                    json.dump(output_val, json_file, indent=2)
-            
-            elif output_types[output_name] == 'csv':
-                output_file = os.path.join(output_dir, f'{output_name}.csv')
-                self.logger(4, f'Saving output {output_name} to {output_file}')
-                output_val.to_csv(
+
+            output_type = output_types[output_name]
+            options = storage_options.get(output_name, None)
+
+            file_name = output_file_name(output_name, output_type)
+            output_file = os.path.join(output_dir, file_name)
+            self.logger(4, f'Saving output {output_name} to {output_file}')
+            start_time = time.perf_counter()
+            stats = save_value(output_val, output_file, output_type, self.pandas_sep, options)
+            node['output_stats'][output_name] = {'save_time': time.perf_counter() - start_time, **stats}
+
+            manifest[output_name] = manifest_entry(output_dir, file_name, output_type, self.verify_checksums)
+
+            # Consumers get the same value they would get from the cache (e.g. the
+            # read only memory map instead of this process private copy)
+            if reload_after_save(output_type, options):
+                node['output'][output_name] = load_value(
                     output_file,
-                    sep=self.pandas_sep,
-                    index=False,
-                    encoding='utf-8'
+                    output_type,
+                    self.pandas_sep,
+                    options
                 )
 
-            elif output_types[output_name] == 'npy':
-                output_file = os.path.join(output_dir, f'{output_name}.npy')
-                self.logger(4, f'Saving output {output_name} to {output_file}')
-                np.save(output_file, output_val)
-            
-            elif output_types[output_name] == 'pickle':
-                output_file = os.path.join(output_dir, f'{output_name}.pickle')
-                self.logger(4, f'Saving output {output_name} to {output_file}')
-                with open(output_file, 'wb') as pickle_file:
-                    pickle.dump(output_val, pickle_file)
-            
-        # Save the node run state as already run
-        run_state_path = os.path.join(output_dir, f'run_state.json')
-        with open(run_state_path, 'w', encoding='utf-8') as state_file:
-            json.dump({'last_run': datetime.now().isoformat()}, state_file)
+        write_manifest(output_dir, manifest)
+        node['manifest'] = manifest
+
+    def _write_run_state(self, node):
+
+        run_state_file = self._run_state_path(node['name'])
+        Path(run_state_file).parent.mkdir(
+            parents=True,
+            exist_ok=True
+        )
+
+        write_json(run_state_file, {
+            **node['run_state'],
+            'last_run': node['run_state']['last_run'].isoformat()
+        })
+
+    def run(self, targets=None):
 
-    def run(self):
-    
         self.logger(2, 'Run execution graph')
-        for node_name in self.graph_.topological_sort():
 
-            self.logger(1, f'Processing node {node_name}')
+        node_names = None
+        if targets is not None:
+            node_names = self._required_nodes(targets)
+            self.logger(2, f'Run only the nodes required by {", ".join(targets)}: {", ".join(node_names)}')
+
+        # Number of nodes still to run that consume each node outputs
+        self.consumers_ = None
+        if self.config.get('general', {}).get('release_outputs', False):
+            self.consumers_ = self._count_consumers(
+                node_names if node_names is not None else self.graph_.nodes(),
+                targets if targets is not None else []
+            )
+
+        executor_config = self.config.get('general', {}).get('executor', None)
+        self.streams_ = []
+        self.io_executor_ = self._io_executor()
+        try:
+            if executor_config is None or executor_config.get('type', 'sequential') == 'sequential':
+                self._run_sequential(node_names)
+            else:
+                self._run_concurrent(executor_config, node_names)
+
+            # Streams that no node consumed until the end still have to be produced and saved
+            for stream in self.streams_:
+                stream.wait()
+        finally:
+            self.io_executor_.shutdown()
+            self.io_executor_ = None
+
+        self._log_profiles(node_names if node_names is not None else self.graph_.topological_sort())
+
+    def _required_nodes(self, targets):
+
+        for target in targets:
+            if target not in self.graph_.nodes():
+                raise ValueError(
+                    f'Target node {target} non existent, options are:'
+                    f'\n\t' + '\n\t'.join(self.graph_.nodes())
+                )
+
+        required = set()
+        to_visit = list(targets)
+        while len(to_visit) > 0:
+            node_name = to_visit.pop()
+            if node_name in required:
+                continue
+
+            required.add(node_name)
+
+            # Already calculated nodes do not need the outputs of their predecessors
+            if self.graph_.node(node_name)['output'] is None:
+                to_visit.extend(self.graph_.nodes(to_node=node_name))
+
+        return [
+            node_name
+            for node_name in self.graph_.topological_sort()
+            if node_name in required
+        ]
+
+    def _run_sequential(self, node_names=None):
+
+        if node_names is None:
+            node_names = self.graph_.topological_sort()
+
+        for node_name in node_names:
+
             node = self.graph_.node(node_name)
-            
-            # If node is already calculated, then skip recalculation
-            if node['output'] is not None:
-                self.logger(2, f'Skipping already executed node: {node_name}')
+            if not self._must_run(node):
                 continue
 
-            if node.get('force_not_rerun', False) and node['run_state']['last_run'] is not None:
-                self.logger(2, f'Skipping already executed note with force not rerun: {node_name}')
-
-            args = []
-            kwargs = {}
-            if 'input_map' in node:
-                self.logger(4, f'Collect {node_name} inputs from dependent nodes') 
-                for sender_node, input_map in node['input_map'].items():
-                    self.logger(6, f'Collect input from {sender_node}', 1)
-                    output = self.graph_.node(sender_node)['output']
-                    for to_param, from_param in input_map.items():
-                        self.logger(
-                            10, f'Map {sender_node}.{from_param} output '
-                            f'to {node_name}.{to_param} input', 2
+            start_time = time.perf_counter()
+            args, kwargs = self._collect_inputs(node)
+            input_time = time.perf_counter() - start_time
+
+            self.logger(2, f'Executing {node_name}')
+            output, profile = GraphRunner._execute_module(
+                node['module'], args, kwargs, self._node_profile_file(node)
+            )
+            self._finish_node(node, output, {**profile, 'input_time': input_time}, args + list(kwargs.values()))
+
+    def _run_concurrent(self, executor_config, node_names=None):
+
+        self.logger(2, f'Run execution graph with a {executor_config["type"]} executor')
+
+        if node_names is None:
+            node_names = self.graph_.nodes()
+
+        # Predecessors of each node that have not finished yet
+        pending = {
+            node_name: set(self.graph_.nodes(to_node=node_name)).intersection(node_names)
+            for node_name in node_names
+        }
+        running = {}
+        input_times = {}
+        inputs = {}
+
+        # Large inputs and outputs go through shared memory, each node outputs segments
+        # are freed when its last consumer finishes
+        transport = None
+        execute_module = GraphRunner._execute_module
+        if uses_shared_memory(executor_config):
+            transport = SharedMemoryTransport()
+            execute_module = GraphRunner._execute_shared_module
+            shared_consumers = self._count_consumers(node_names, [])
+
+        # Nodes that read or return streams run in threads of this process, which share the streams
+        local_executor = executor_config['type'] != 'thread'
+
+        with transport or nullcontext(), make_executor(executor_config) as executor, \
+                ThreadPoolExecutor(thread_name_prefix='ConPipe-stream') as stream_executor:
+            while len(pending) > 0 or len(running) > 0:
+
+                ready = [
+                    node_name
+                    for node_name, predecessors in pending.items()
+                    if len(predecessors) == 0
+                ]
+
+                if len(ready) == 0 and len(running) == 0:
+                    raise ValueError(
+                        'The execution graph has nodes that can never run: '
+                        + ', '.join(pending.keys())
+                    )
+
+                for node_name in ready:
+                    del pending[node_name]
+                    node = self.graph_.node(node_name)
+
+                    if not self._must_run(node):
+                        self._mark_finished(node_name, pending)
+                        continue
+
+                    local = local_executor and GraphRunner._is_streaming(node)
+
+                    start_time = time.perf_counter()
+                    args, kwargs = self._collect_inputs(
+                        node,
+                        transport.share if transport is not None and not local else None
+                    )
+                    input_times[node_name] = time.perf_counter() - start_time
+                    inputs[node_name] = args + list(kwargs.values())
+
+                    self.logger(2, f'Dispatching {node_name}')
+                    if local or executor_config['type'] == 'thread':
+                        future = (stream_executor if local else executor).submit(
+                            GraphRunner._execute_module,
+                            node['module'],
+                            args,
+                            kwargs,
+                            self._node_profile_file(node),
+                            thread_cpu=True
+                        )
+                    else:
+                        future = executor.submit(
+                            execute_module,
+                            node['module'],
+                            args,
+                            kwargs,
+                            self._node_profile_file(node)
                         )
+                    running[future] = (node_name, local)
+
+                if len(running) == 0:
+                    continue
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    node_name, local = running.pop(future)
+                    node = self.graph_.node(node_name)
+
+                    self.logger(2, f'Finished {node_name}')
+                    output, profile = future.result()
+                    if transport is not None:
+                        if not local:
+                            output = transport.adopt(output, node_name)
+                        self._release_shared_inputs(transport, node, shared_consumers)
+
+                    self._finish_node(
+                        node,
+                        output,
+                        {**profile, 'input_time': input_times.pop(node_name)},
+                        inputs.pop(node_name)
+                    )
+                    self._mark_finished(node_name, pending)
+
+    # Nodes that return a stream are completed when their stream ends
+    def _finish_node(self, node, output, profile, inputs):
+        if node.get('stream_output', False):
+            self._start_stream(node, output, profile, inputs)
+        else:
+            node['output'] = output
+            close_readers(inputs)
+            self._complete_node(node, profile)
+
+    def _start_stream(self, node, batches, profile, inputs):
+
+        if isinstance(batches, dict):
+            raise ValueError(f'Stream node {node["name"]} must return an iterator of batches instead of a dict')
+
+        output_dir = None
+        if 'output_storage_type' in node:
+            output_dir = self._output_dir(node['name'])
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+            # The old run state is removed first, so its cache key never matches partially replaced chunks
+            with directory_lock(os.path.join(self.save_dir, node['name'])):
+                if os.path.exists(self._run_state_path(node['name'])):
+                    os.remove(self._run_state_path(node['name']))
+
+        node['output'] = StreamOutput(
+            node['name'],
+            batches,
+            output_dir,
+            node.get('output_storage_type', None),
+            self.pandas_sep,
+            node.get('output_storage_options', {}),
+            node.get('stream_queue_size', DEFAULT_QUEUE_SIZE),
+            on_complete=lambda stream: self._complete_stream(node, profile, stream, inputs),
+            checksums=self.verify_checksums
+        )
+        self.streams_.append(node['output'])
 
-                        if type(to_param) == int:
-                            args.append((to_param, output[from_param]))
-                        else:
-                            kwargs[to_param] = output[from_param]
+    # Runs in the stream thread once the node has returned all its batches
+    def _complete_stream(self, node, profile, stream, inputs):
 
-                args = sorted(args, key=lambda x: x[0])
-                args = [x[1] for x in args]
+        close_readers(inputs)
 
-            self.logger(2, f'Executing {node_name}')
-            node['output'] = node['module'].run(*args, **kwargs)
+        with directory_lock(os.path.join(self.save_dir, node['name'])):
+            if stream.manifest_ is not None:
+                write_manifest(self._output_dir(node['name']), stream.manifest_)
+                node['manifest'] = stream.manifest_
+
+            profile = {**profile, **stream.stats_}
+            profile['outputs'] = {
+                output_name: {'size': entry['size']}
+                for output_name, entry in node.get('manifest', {}).items()
+            }
+
+            node['run_state'] = {
+                'last_run': datetime.now(),
+                'cache_key': node['cache_key'],
+                'profile': profile
+            }
+            self._write_run_state(node)
+        node['profiled'] = True
 
+        # Nodes that read the stream later replay its chunks from disk
+        if stream.manifest_ is not None:
+            node['output'] = self._lazy_output(node, stream.manifest_)
+
+        if self.consumers_ is not None:
+            self._release_inputs(node)
+
+    def _release_shared_inputs(self, transport, node, shared_consumers):
+        for sender_node in node.get('input_map', {}).keys():
+            if sender_node not in shared_consumers:
+                continue
+
+            shared_consumers[sender_node] -= 1
+            if shared_consumers[sender_node] == 0:
+                transport.release(sender_node)
+
+    def _mark_finished(self, node_name, pending):
+        for successor in self.graph_.nodes(from_node=node_name):
+            if successor in pending:
+                pending[successor].discard(node_name)
+
+    def _must_run(self, node):
+
+        node_name = node['name']
+        self.logger(1, f'Processing node {node_name}')
+
+        # If node is already calculated, then skip recalculation
+        if node['output'] is not None:
+            self.logger(2, f'Skipping already executed node: {node_name}')
+            return False
+
+        if node.get('force_not_rerun', False) and node['run_state']['last_run'] is not None:
+            self.logger(2, f'Skipping already executed note with force not rerun: {node_name}')
+
+        return True
+
+    # map_input(value, sender_node) optionally replaces each input value (e.g. by a shared memory handle)
+    def _collect_inputs(self, node, map_input=None):
+
+        node_name = node['name']
+
+        args = []
+        kwargs = {}
+        if 'input_map' in node:
+            self.logger(4, f'Collect {node_name} inputs from dependent nodes') 
+
+            # Cached inputs are loaded from disk concurrently before mapping them, except streamed ones
+            stream_inputs = node.get('stream_inputs', [])
+            futures = []
+            for sender_node, input_map in node['input_map'].items():
+                output = self.graph_.node(sender_node)['output']
+                if isinstance(output, LazyOutput) and sender_node not in stream_inputs:
+                    futures.extend(output.prefetch(
+                        self.io_executor_,
+                        [from_param for from_param in input_map.values() if from_param is not None]
+                    ))
+            self._wait_loads(futures)
+
+            for sender_node, input_map in node['input_map'].items():
+                self.logger(6, f'Collect input from {sender_node}', 1)
+                output = self.graph_.node(sender_node)['output']
+                for to_param, from_param in input_map.items():
+                    # Null mappings remove inputs inherited from the base module
+                    if from_param is None:
+                        continue
+
+                    self.logger(
+                        10, f'Map {sender_node}.{from_param} output '
+                        f'to {node_name}.{to_param} input', 2
+                    )
+
+                    if sender_node in stream_inputs:
+                        value = stream_value(output, from_param)
+                    else:
+                        value = output[from_param]
+
+                    if map_input is not None:
+                        value = map_input(value, sender_node)
+
+                    if type(to_param) == int:
+                        args.append((to_param, value))
+                    else:
+                        kwargs[to_param] = value
+
+            args = sorted(args, key=lambda x: x[0])
+            args = [x[1] for x in args]
+
+        return args, kwargs
+
+    def _complete_node(self, node, profile):
+
+        # Other processes running the same node (e.g. sweeps) must not interleave their writes
+        with directory_lock(os.path.join(self.save_dir, node['name'])):
+
+            # The old run state is removed first, so its cache key never matches partially replaced outputs
+            if os.path.exists(self._run_state_path(node['name'])):
+                os.remove(self._run_state_path(node['name']))
+
+            start_time = time.perf_counter()
             if 'output_storage_type' in node:
                 self._save_output(node)
+            profile['save_time'] = time.perf_counter() - start_time
+
+            profile['outputs'] = {
+                output_name: {'size': entry['size'], **node['output_stats'][output_name]}
+                for output_name, entry in node.get('manifest', {}).items()
+            }
+
+            # Save the node run state as already run
+            node['run_state'] = {
+                'last_run': datetime.now(),
+                'cache_key': node['cache_key'],
+                'profile': profile
+            }
+            self._write_run_state(node)
+        node['profiled'] = True
+
+        if self.consumers_ is not None:
+            self._release_inputs(node)
+
+    def _node_profile_file(self, node):
+        if not node.get('profile', False):
+            return None
+
+        profile_file = self._profile_path(node['name'])
+        Path(profile_file).parent.mkdir(
+            parents=True,
+            exist_ok=True
+        )
+        return profile_file
+
+    def _log_profiles(self, node_names):
+
+        profiles = {}
+        for node_name in node_names:
+            node = self.graph_.node(node_name)
+
+            # Cached outputs loaded in this run update the load times of their node run state
+            output = node['output']
+            if isinstance(output, LazyOutput) and len(output.load_times) > 0 and node['run_state']['last_run'] is not None \
+                    and 'cache_path' not in node:
+                outputs = node['run_state']['profile'].setdefault('outputs', {})
+                for output_name, load_time in output.load_times.items():
+                    outputs.setdefault(output_name, {})['load_time'] = load_time
+                self._write_run_state(node)
+
+            if node.get('profiled', False) or (isinstance(output, LazyOutput) and len(output.load_times) > 0):
+                profiles[node_name] = node['run_state']['profile']
+
+            if node.get('profiled', False) and node.get('profile', False):
+                profile_config = node['profile'] if isinstance(node['profile'], dict) else {}
+                self.logger(1, f'Profile of node {node_name}:')
+                self.logger(1, profile_report(self._profile_path(node_name), **profile_config))
+
+        if len(profiles) > 0:
+            self.logger(1, 'Node profiles:')
+            self.logger(1, profile_table(profiles))
+
+    def _count_consumers(self, node_names, targets):
+
+        # Targets outputs are the run results, so they are never released
+        consumers = {
+            node_name: 0
+            for node_name in node_names
+            if node_name not in targets
+        }
+
+        for node_name in node_names:
+            node = self.graph_.node(node_name)
+
+            # Already calculated nodes do not read their inputs
+            if node['output'] is not None:
+                continue
+
+            for sender_node in node.get('input_map', {}).keys():
+                if sender_node in consumers:
+                    consumers[sender_node] += 1
+
+        return consumers
+
+    def _release_inputs(self, node):
+
+        # Stream nodes release their inputs from their own thread
+        with self._release_lock:
+            for sender_node in node.get('input_map', {}).keys():
+                if sender_node not in self.consumers_:
+                    continue
+
+                self.consumers_[sender_node] -= 1
+                if self.consumers_[sender_node] == 0:
+                    self._release_output(self.graph_.node(sender_node))
+
+    def _release_output(self, node):
+
+        if node.get('pin_output', False) or node['output'] is None:
+            return
+
+        self.logger(4, f'Release {node["name"]} outputs from memory')
+
+        # Persisted outputs are reloaded from disk if they are needed again
+        if isinstance(node['output'], LazyOutput):
+            node['output'].release()
+        elif 'manifest' in node:
+            node['output'] = self._lazy_output(node, node['manifest'])
+        else:
+            node['output'] = None
 
     ######################
     ### Static methods ###
@@ -325,6 +894,10 @@ class GraphRunner():
                 GraphRunner.dict_merge(config[module_name], module_config)
 
         for module_name, kwargs in custom_config.items():
+
+            # General settings can be given even if the config files do not have them
+            if module_name == 'general':
+                config.setdefault('general', {})
             
             if module_name not in config:
                 raise ValueError(
@@ -336,6 +909,31 @@ class GraphRunner():
 
         return config
 
+    @staticmethod
+    def _is_streaming(node):
+        return node.get('stream_output', False) or len(node.get('stream_inputs', [])) > 0
+
+    # Function submitted to the executors to run a node module and measure its resources,
+    # with thread_cpu for the nodes that run on a thread next to other nodes
+    @staticmethod
+    def _execute_module(module, args, kwargs, profile_file=None, thread_cpu=False):
+        return run_profiled(module.run, args, kwargs, profile_file, thread_cpu)
+
+    # Function submitted to process executors with the shared memory transport. The output is
+    # shared back and the segments of the inputs are detached from the worker once it finishes.
+    @staticmethod
+    def _execute_shared_module(module, args, kwargs, profile_file=None):
+
+        args = [load_shared(arg) for arg in args]
+        kwargs = {name: load_shared(value) for name, value in kwargs.items()}
+        output, stats = run_profiled(module.run, args, kwargs, profile_file)
+
+        shared_output = export_value(output)
+        del args, kwargs, output
+        release_attached()
+
+        return shared_output, stats
+
     # Function used to assign to a node in order to bypass its calculations
     @staticmethod
     def _bypass_node(*args, **kwargs):
@@ -353,6 +951,20 @@ class GraphRunner():
         
         return outputs
 
+    # Recursively converts the config keys to str so configs with mixed key types can be sorted
+    @staticmethod
+    def _canonical_config(config):
+        if isinstance(config, dict):
+            return {
+                str(key): GraphRunner._canonical_config(value)
+                for key, value in config.items()
+            }
+
+        if isinstance(config, (list, tuple)):
+            return [GraphRunner._canonical_config(value) for value in config]
+
+        return config
+
     @staticmethod
     def dict_merge(dct, merge_dct):
         """ Recursive dict merge. Inspired by :meth:``dict.update()``, instead of
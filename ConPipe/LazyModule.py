@@ -0,0 +1,30 @@
+from ConPipe.FunctionModule import FunctionModule
+from ConPipe.ModuleLoader import get_class, get_function
+
+
+class LazyModule():
+    """ Node module that imports and builds its class or function module the first
+    time it runs, so nodes that are cached or not required never import them
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._module = None
+
+    def module(self):
+
+        if self._module is None:
+            if 'class' in self.config:
+                self._module = get_class(self.config['class'])(
+                    **self.config.get('parameters', {})
+                )
+            else:
+                self._module = FunctionModule(
+                    function=get_function(self.config['function']),
+                    parameters=self.config.get('parameters', {})
+                )
+
+        return self._module
+
+    def run(self, *args, **kwargs):
+        return self.module().run(*args, **kwargs)
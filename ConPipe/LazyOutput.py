@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections.abc import Mapping
+
+from ConPipe.Logger import Logger
+from ConPipe.storage import load_value, output_files, output_size, file_checksum
+from ConPipe.StreamOutput import concat_batches
+
+
+class LazyOutput(Mapping):
+    """ Read only mapping over the cached outputs of a node that loads each
+    output from disk the first time it is accessed. With verify_checksums the files of the
+    outputs saved with a checksum are checked before loading them.
+    """
+
+    def __init__(self, output_dir, manifest, pandas_sep=';', storage_options=None, verify_checksums=False):
+        self.output_dir = output_dir
+        self.manifest = manifest
+        self.pandas_sep = pandas_sep
+        self.storage_options = storage_options if storage_options is not None else {}
+        self.verify_checksums = verify_checksums
+        self.logger = Logger()
+
+        self._values = {}
+
+        # One lock per output, so different outputs can be loaded at the same time from several threads
+        self._lock = threading.Lock()
+        self._output_locks = {}
+
+        # Seconds spent loading each output from disk
+        self.load_times = {}
+
+    def __getitem__(self, output_name):
+
+        with self._lock:
+            if output_name in self._values:
+                return self._values[output_name]
+            output_lock = self._output_locks.setdefault(output_name, threading.Lock())
+
+        with output_lock:
+            if output_name not in self._values:
+                value = self._load(output_name)
+                with self._lock:
+                    self._values[output_name] = value
+
+            return self._values[output_name]
+
+    def __iter__(self):
+        return iter(self.manifest)
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def is_loaded(self, output_name):
+        return output_name in self._values
+
+    def prefetch(self, executor, output_names=None):
+        """ Submits the loads of the not yet loaded outputs (all of them by default) to the
+        executor and returns their futures
+        """
+        output_names = output_names if output_names is not None else self.manifest.keys()
+        return [
+            executor.submit(self.__getitem__, output_name)
+            for output_name in output_names
+            if not self.is_loaded(output_name)
+        ]
+
+    def stream(self, output_name):
+        """ Iterator over the batches of a streamed output, loading one chunk at a time.
+        Outputs that were not streamed are a single batch.
+        """
+
+        entry = self.manifest[output_name]
+        if 'chunks' not in entry:
+            yield self[output_name]
+            return
+
+        for chunk in entry['chunks']:
+            yield self._load_file(output_name, chunk, entry['format'])
+
+    # Drop the loaded values, they are loaded again from disk on the next access
+    def release(self):
+        with self._lock:
+            self._values = {}
+
+    def _load(self, output_name):
+
+        entry = self.manifest[output_name]
+        paths = [
+            os.path.join(self.output_dir, file_name)
+            for file_name in entry.get('chunks', [entry['file']])
+        ]
+
+        files = [path for file in paths for path in output_files(file, entry['format'])]
+        size = output_size(files)
+        if size != entry['size']:
+            raise ValueError(
+                f'Cached output {paths[0]} has {size} bytes '
+                f'but {entry["size"]} were saved, the node cache is corrupted'
+            )
+
+        if self.verify_checksums and entry.get('checksum', None) is not None:
+            if file_checksum(files) != entry['checksum']:
+                raise ValueError(
+                    f'Cached output {paths[0]} does not match the checksum it was saved with, '
+                    'the node cache is corrupted'
+                )
+
+        self.logger(6, f'Load {entry["file"]} output', 2)
+        start_time = time.perf_counter()
+        if 'chunks' in entry:
+            value = concat_batches([
+                self._load_file(output_name, chunk, entry['format'])
+                for chunk in entry['chunks']
+            ])
+        else:
+            value = self._load_file(output_name, entry['file'], entry['format'])
+        self.load_times[output_name] = time.perf_counter() - start_time
+        self.logger(5, f'Loaded {entry["file"]} in {self.load_times[output_name]:.3f} seconds', 2)
+
+        return value
+
+    def _load_file(self, output_name, file_name, storage_type):
+        return load_value(
+            os.path.join(self.output_dir, file_name),
+            storage_type,
+            self.pandas_sep,
+            self.storage_options.get(output_name, None)
+        )
@@ -11,3 +11,7 @@ class Logger():
     
     def __call__(self, verbose, msgs, ident=0):
         self.log(verbose, msgs, ident=ident)
+
+    # Unpickled loggers (e.g. inside worker processes) resolve to the process singleton
+    def __reduce__(self):
+        return (Logger, (self.verbose,))
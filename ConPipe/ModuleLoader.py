@@ -1,8 +1,11 @@
 import sys
 import os
 from pathlib import Path
+import ast
 import importlib
+import importlib.util
 import inspect
+import hashlib
 
 from ConPipe.exceptions import NotFunctionModuleError, NotClassModuleError
 
@@ -38,6 +41,52 @@ def get_class(class_name):
     
     return class_obj
 
+def get_module_fingerprint(object_name):
+
+    # Modules not imported yet are fingerprinted from their source file, without importing them
+    source = find_object_source(object_name)
+    if source is not None:
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    return get_object_fingerprint(get_module_object(object_name), object_name)
+
+def find_object_source(object_name):
+    """ Source of a class or function defined at the top level of a python module file,
+    the same one inspect.getsource returns, read without importing the module. Returns None
+    if the module is already imported or the object is not defined in its file (e.g. it is
+    imported from another module).
+    """
+    module_name, obj_name = split_module_name(object_name)
+    if module_name in sys.modules:
+        return None
+
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+
+    if spec is None or spec.origin is None or not spec.origin.endswith('.py'):
+        return None
+
+    with open(spec.origin, 'r', encoding='utf-8') as source_file:
+        source = source_file.read()
+
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == obj_name:
+            first_line = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            return ''.join(source.splitlines(keepends=True)[first_line - 1:node.end_lineno])
+
+    return None
+
+def get_object_fingerprint(obj, object_name=None):
+    try:
+        source = inspect.getsource(obj)
+    except (OSError, TypeError):
+        # Builtin or compiled objects have no python source, their full name is used instead
+        source = f'{getattr(obj, "__module__", "")}.{getattr(obj, "__qualname__", object_name)}'
+
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
 def add_path_to_modules(configs_path, modules_root, module_paths, logger):
     
     if not os.path.isabs(modules_root):
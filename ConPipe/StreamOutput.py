@@ -0,0 +1,331 @@
+import os
+import shutil
+import threading
+import time
+from collections.abc import Mapping
+
+from ConPipe.Logger import Logger
+from ConPipe.storage import chunk_path, chunks_manifest_entry, save_value, load_value
+
+DEFAULT_QUEUE_SIZE = 4
+
+
+class StreamOutput(Mapping):
+    """ Outputs of a streaming node, whose run returns an iterator of batches (dicts with
+    the value of each output in the batch). A background thread pulls the batches, saves
+    each one as a chunk file when output_dir is set and hands them to the readers of the
+    stream (see stream). The thread waits while the readers have queue_size batches not
+    yet consumed, so a slow consumer slows down the node instead of filling the memory.
+    """
+
+    def __init__(self, name, batches, output_dir=None, output_types=None, pandas_sep=';',
+                 storage_options=None, queue_size=DEFAULT_QUEUE_SIZE, on_complete=None, checksums=False):
+
+        self.name = name
+        self.batches = batches
+        self.output_dir = output_dir
+        self.output_types = output_types
+        self.pandas_sep = pandas_sep
+        self.storage_options = storage_options if storage_options is not None else {}
+        self.queue_size = max(int(queue_size), 1)
+        self.on_complete = on_complete
+        self.checksums = checksums
+        self.logger = Logger()
+
+        self._condition = threading.Condition()
+        self._thread = None
+        self._readers = []
+        self._window = {}
+        self._produced = 0
+        self._done = False
+        self._error = None
+
+        self.output_names_ = None
+        self.manifest_ = None
+        self.stats_ = {}
+
+    def __getitem__(self, output_name):
+        return concat_batches(list(self.stream(output_name)))
+
+    def __iter__(self):
+        return iter(self._wait_output_names())
+
+    def __len__(self):
+        return len(self._wait_output_names())
+
+    def stream(self, output_name):
+        """ Iterator over the batches of an output, each call is an independent reader """
+        return StreamReader(self, output_name)
+
+    def wait(self):
+        """ Runs the stream to the end (even without readers) and raises its error, if any """
+        self._start()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _wait_output_names(self):
+        with self._condition:
+            self._start()
+            while self.output_names_ is None and not self._done and self._error is None:
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            return self.output_names_ if self.output_names_ is not None else []
+
+    def _start(self):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._produce,
+                    name=f'ConPipe-stream-{self.name}',
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _produce(self):
+
+        start_time = time.perf_counter()
+        cpu_start = time.thread_time()
+        save_time = 0.0
+
+        try:
+            for batch in self.batches:
+                batch_idx = self._produced
+                self._check_batch(batch, batch_idx)
+
+                if self.output_dir is not None:
+                    save_start = time.perf_counter()
+                    self._save_chunk(batch, batch_idx)
+                    save_time += time.perf_counter() - save_start
+
+                with self._condition:
+                    self._window[batch_idx] = batch
+                    self._produced += 1
+                    self._evict()
+                    self._condition.notify_all()
+
+                    # Backpressure: wait until the readers consume the batches in memory
+                    while self._must_wait():
+                        self._condition.wait()
+
+            if self.output_dir is not None:
+                self.manifest_ = {
+                    output_name: chunks_manifest_entry(
+                        self.output_dir,
+                        output_name,
+                        self._output_type(output_name),
+                        self._produced,
+                        self.checksums
+                    )
+                    for output_name in (self.output_names_ or [])
+                }
+
+            self.stats_ = {
+                'wall_time': time.perf_counter() - start_time,
+                'cpu_time': time.thread_time() - cpu_start,
+                'save_time': save_time,
+                'batches': self._produced
+            }
+            self.logger(2, f'Stream {self.name} finished after {self._produced} batches')
+
+        except BaseException as error:
+            with self._condition:
+                self._error = error
+                self._condition.notify_all()
+            return
+
+        with self._condition:
+            self._done = True
+            self._condition.notify_all()
+
+        try:
+            if self.on_complete is not None:
+                self.on_complete(self)
+        except BaseException as error:
+            self._error = error
+
+    def _check_batch(self, batch, batch_idx):
+
+        if not isinstance(batch, dict):
+            raise ValueError(f'Batches of the stream node {self.name} must be dicts of outputs, got {type(batch)}')
+
+        with self._condition:
+            if self.output_names_ is None:
+                self.output_names_ = list(batch.keys())
+                self._condition.notify_all()
+            elif set(batch.keys()) != set(self.output_names_):
+                raise ValueError(
+                    f'Batch {batch_idx} of the stream node {self.name} has the outputs '
+                    f'{", ".join(batch.keys())} but the first one had {", ".join(self.output_names_)}'
+                )
+
+    def _output_type(self, output_name):
+        if isinstance(self.output_types, dict):
+            return self.output_types[output_name]
+        return self.output_types
+
+    def _save_chunk(self, batch, batch_idx):
+
+        for output_name, value in batch.items():
+            output_type = self._output_type(output_name)
+            path = chunk_path(self.output_dir, output_name, output_type, batch_idx)
+
+            # Chunks of a previous run of the node are replaced
+            if batch_idx == 0:
+                shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+                os.makedirs(os.path.dirname(path))
+
+            save_value(value, path, output_type, self.pandas_sep, self.storage_options.get(output_name, None))
+
+    def _load_chunk(self, output_name, batch_idx):
+
+        if self.output_dir is None:
+            raise ValueError(
+                f'Batch {batch_idx} of the stream node {self.name} was already released. Streams consumed '
+                'more than once or by inputs that are not read together (e.g. with zip) need an output_storage_type'
+            )
+
+        output_type = self._output_type(output_name)
+        return load_value(
+            chunk_path(self.output_dir, output_name, output_type, batch_idx),
+            output_type,
+            self.pandas_sep,
+            self.storage_options.get(output_name, None)
+        )
+
+    # Readers that have queue_size batches to consume. Batches that are saved to disk can be read
+    # again, so only the most advanced reader holds back the stream, otherwise the least advanced.
+    def _lagging_readers(self):
+
+        if len(self._readers) == 0:
+            return []
+
+        positions = [reader.position for reader in self._readers]
+        position = max(positions) if self.output_dir is not None else min(positions)
+        if self._produced - position < self.queue_size:
+            return []
+
+        return [reader for reader in self._readers if self._produced - reader.position >= self.queue_size]
+
+    def _must_wait(self):
+        return len(self._lagging_readers()) > 0 and self._error is None
+
+    def _evict(self):
+
+        first_needed = self._produced - self.queue_size
+        if self.output_dir is None and len(self._readers) > 0:
+            first_needed = min(first_needed, min(reader.position for reader in self._readers))
+
+        for batch_idx in [batch_idx for batch_idx in self._window if batch_idx < first_needed]:
+            del self._window[batch_idx]
+
+    def _next(self, reader):
+
+        with self._condition:
+            if reader not in self._readers:
+                self._readers.append(reader)
+                reader.thread = threading.get_ident()
+            self._start()
+
+            while reader.position >= self._produced and not self._done and self._error is None:
+                # The stream waits for readers of this same thread, which can not advance while it waits
+                lagging = self._lagging_readers()
+                if len(lagging) > 0 and all(other.thread == reader.thread for other in lagging):
+                    raise ValueError(
+                        f'The outputs of the stream node {self.name} read by this node are too far apart, '
+                        'read them together (e.g. with zip) or save the stream with an output_storage_type'
+                    )
+                self._condition.wait()
+
+            if self._error is not None:
+                raise self._error
+
+            if reader.position >= self._produced:
+                reader.closed = True
+                self._close(reader)
+                raise StopIteration
+
+            batch_idx = reader.position
+            reader.position += 1
+            batch = self._window.get(batch_idx, None)
+            self._evict()
+            self._condition.notify_all()
+
+        if batch is None:
+            return self._load_chunk(reader.output_name, batch_idx)
+
+        if reader.output_name not in batch:
+            raise ValueError(
+                f'Output {reader.output_name} non existent in the stream node {self.name}, '
+                f'options are: {", ".join(batch.keys())}'
+            )
+        return batch[reader.output_name]
+
+    def _close(self, reader):
+        with self._condition:
+            if reader in self._readers:
+                self._readers.remove(reader)
+                self._evict()
+                self._condition.notify_all()
+
+
+class StreamReader():
+    """ Iterator over the batches of one output of a StreamOutput """
+
+    def __init__(self, stream, output_name):
+        self.stream = stream
+        self.output_name = output_name
+        self.position = 0
+        self.thread = None
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        return self.stream._next(self)
+
+    # Readers that stop before the end of the stream must be closed so they do not hold it back
+    def close(self):
+        self.closed = True
+        self.stream._close(self)
+
+    def __del__(self):
+        self.close()
+
+
+def stream_value(output, output_name):
+    """ Iterator over the batches of a node output, outputs that are not streamed are a single batch """
+    if hasattr(output, 'stream'):
+        return output.stream(output_name)
+    return iter([output[output_name]])
+
+
+def close_readers(values):
+    for value in values:
+        if isinstance(value, StreamReader):
+            value.close()
+
+
+def concat_batches(batches):
+    """ Concatenates the batches of a streamed output along their first axis """
+
+    if len(batches) == 0:
+        return []
+
+    first = batches[0]
+    if hasattr(first, 'iloc'):
+        import pandas as pd
+        return pd.concat(batches, ignore_index=True)
+
+    if hasattr(first, 'shape'):
+        import numpy as np
+        return np.concatenate(batches)
+
+    if isinstance(first, list):
+        return [value for batch in batches for value in batch]
+
+    return batches
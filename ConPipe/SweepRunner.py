@@ -0,0 +1,148 @@
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import itertools
+import os
+import sys
+
+from ConPipe.GraphRunner import GraphRunner
+from ConPipe.executors import init_worker, process_context
+from ConPipe.Logger import Logger
+from ConPipe.storage import write_json
+
+
+class SweepRunner():
+    """ Runs a graph once per combination of the sweep grid overrides. Nodes whose cache keys
+    are the same in all the variants run once in the base execution state, and the rest of
+    each variant runs in a process pool on its own <save_path>/sweep/variant_<i> directory.
+    """
+
+    def __init__(self, config_paths, custom_config, sweep_grid, max_workers=None):
+
+        if len(sweep_grid) == 0:
+            raise ValueError('The sweep grid must have at least one parameter')
+
+        # Workers change their working directory, so config paths must be absolute
+        self.config_paths = [os.path.abspath(config_path) for config_path in config_paths]
+        self.max_workers = int(max_workers) if max_workers is not None else None
+
+        # Each variant overrides the flat keys (e.g. data_split.parameters.test_size) with one grid value
+        parameters = list(sweep_grid.keys())
+        self.variants_ = [
+            dict(zip(parameters, values))
+            for values in itertools.product(*[sweep_grid[parameter] for parameter in parameters])
+        ]
+
+        self.base_runner_ = GraphRunner(self.config_paths, custom_config)
+        self.logger = Logger()
+
+        self.save_path = os.path.dirname(self.base_runner_.save_dir)
+        self.sweep_path = os.path.join(self.save_path, 'sweep')
+
+        self.variant_configs_ = []
+        for variant_idx, variant in enumerate(self.variants_):
+            variant_config = copy.deepcopy(dict(custom_config))
+            for parameter, value in variant.items():
+                GraphRunner.dict_merge(variant_config, SweepRunner._nested_config(parameter, value))
+
+            # Variants read the shared nodes from the base execution state and write the rest in their own directory
+            GraphRunner.dict_merge(variant_config, {
+                'general': {
+                    'save_path': self._variant_path(variant_idx),
+                    'cache_paths': [self.base_runner_.save_dir]
+                }
+            })
+            self.variant_configs_.append(variant_config)
+
+    def run(self, targets=None):
+
+        runners = [
+            GraphRunner(self.config_paths, variant_config)
+            for variant_config in self.variant_configs_
+        ]
+
+        shared_nodes = self._shared_nodes(runners)
+        self.logger(1, f'Sweep of {len(self.variants_)} variants, shared nodes: {", ".join(shared_nodes)}')
+
+        write_json(
+            os.path.join(self.sweep_path, 'variants.json'),
+            {f'variant_{variant_idx}': variant for variant_idx, variant in enumerate(self.variants_)},
+            indent=2,
+            default=str
+        )
+
+        if len(shared_nodes) > 0:
+            # Shared nodes get the same config in every variant, so the first one is used
+            shared_runner = GraphRunner(self.config_paths, {
+                **self.variant_configs_[0],
+                'general': {
+                    **self.variant_configs_[0]['general'],
+                    'save_path': self.save_path,
+                    'cache_paths': []
+                }
+            })
+            shared_runner.run(targets=shared_nodes)
+
+        self.logger(1, 'Run the variants')
+        with ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=process_context(),
+            initializer=init_worker,
+            initargs=(list(sys.path), self.logger.verbose)
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _run_variant,
+                    self.config_paths,
+                    variant_config,
+                    self._variant_path(variant_idx),
+                    targets
+                )
+                for variant_idx, variant_config in enumerate(self.variant_configs_)
+            ]
+
+            errors = []
+            for variant_idx, future in enumerate(futures):
+                try:
+                    future.result()
+                    self.logger(1, f'Variant {variant_idx} finished: {self.variants_[variant_idx]}')
+                except Exception as error:
+                    self.logger(1, f'Variant {variant_idx} failed: {error}')
+                    errors.append(variant_idx)
+
+        if len(errors) > 0:
+            raise RuntimeError(f'Sweep variants {", ".join(map(str, errors))} failed')
+
+    def _variant_path(self, variant_idx):
+        return os.path.join(self.sweep_path, f'variant_{variant_idx}')
+
+    # Nodes with the same cache key in all the variants whose outputs can be cached
+    def _shared_nodes(self, runners):
+
+        graph = runners[0].graph_
+        return [
+            node_name
+            for node_name in graph.topological_sort()
+            if graph.node(node_name).get('cache_output', True)
+            and 'output_storage_type' in graph.node(node_name)
+            and all(
+                runner.graph_.node(node_name)['cache_key'] == graph.node(node_name)['cache_key']
+                for runner in runners
+            )
+        ]
+
+    @staticmethod
+    def _nested_config(flat_key, value):
+        config = value
+        for key in reversed(flat_key.split('.')):
+            config = {key: config}
+        return config
+
+
+# Runs a variant in a worker process. Paths relative to the working directory
+# (e.g. the ResultEvaluation output_path) are resolved inside the variant directory.
+def _run_variant(config_paths, variant_config, variant_path, targets):
+
+    os.makedirs(variant_path, exist_ok=True)
+    os.chdir(variant_path)
+
+    GraphRunner(config_paths, variant_config).run(targets=targets)
@@ -1,5 +1,8 @@
+from functools import wraps
+
 def singleton(class_):
     instances = {}
+    @wraps(class_, updated=())
     def getinstance(*args, **kwargs):
         if class_ not in instances:
             instances[class_] = class_(*args, **kwargs)
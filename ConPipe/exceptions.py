@@ -7,4 +7,5 @@ class NotFunctionModuleError(ValueError, AttributeError):
 class NotClassModuleError(ValueError, AttributeError):
     """ Exception to raise if a module is not a class """
 
-
+class NotSharedMetricError(ValueError):
+    """ Exception to raise if a score cannot be derived from the shared metric intermediates """
@@ -0,0 +1,341 @@
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing.connection import Listener, Client
+
+from ConPipe.Logger import Logger
+
+EXECUTOR_TYPES = ('thread', 'process', 'socket')
+
+DEFAULT_PORT = 6070
+
+
+def make_executor(executor_config):
+    """ Executor (concurrent.futures interface) of an executor config, whose type
+    is thread, process or socket and the rest are the executor parameters
+    """
+
+    executor_type = executor_config.get('type', 'thread')
+    max_workers = executor_config.get('max_workers', None)
+    if max_workers is not None:
+        max_workers = int(max_workers)
+
+    if executor_type == 'thread':
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    # Workers must be able to import the same node modules as this process
+    initargs = (list(sys.path), Logger().verbose)
+
+    if executor_type == 'process':
+        # Nodes are dispatched while stream threads run, so workers are not forked (see process_context)
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=process_context(),
+            initializer=init_worker,
+            initargs=initargs
+        )
+
+    if executor_type == 'socket':
+        if executor_config.get('authkey', None) is None:
+            raise ValueError('Socket executors need an authkey shared with their workers')
+
+        return SocketExecutor(
+            host=executor_config.get('host', 'localhost'),
+            port=int(executor_config.get('port', DEFAULT_PORT)),
+            authkey=str(executor_config['authkey']),
+            initializer=init_worker,
+            initargs=initargs
+        )
+
+    raise ValueError(
+        f'Executor type {executor_type} non existent, options are: '
+        + ', '.join(EXECUTOR_TYPES)
+    )
+
+
+def process_context():
+    """ Multiprocessing context of the process pools. Forked workers inherit the locks held by
+    the other threads of this process at fork time (e.g. the import lock), so workers are started
+    from a forkserver where it is available and spawned otherwise.
+    """
+
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+# Worker initializer to replicate the module paths and verbosity of the coordinator process
+def init_worker(paths, verbose):
+    for path in paths:
+        if path not in sys.path:
+            sys.path.append(path)
+
+    Logger(verbose)
+
+
+class _Task():
+
+    def __init__(self, future, function, args, kwargs):
+        self.future = future
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.started = False
+
+
+class SocketExecutor(Executor):
+    """ Coordinator of a pool of workers (see run_worker) that connect to host:port,
+    possibly from other machines. Each connected worker pulls one pickled task at a
+    time and pushes back its result. Tasks of workers that disconnect are requeued, or
+    fail after shutdown if no worker is left to run them.
+    Only use it on trusted networks: tasks and results are pickles authenticated with
+    the authkey, but not encrypted.
+    """
+
+    def __init__(self, host='localhost', port=DEFAULT_PORT, authkey=None, initializer=None, initargs=()):
+
+        self.initializer = initializer
+        self.initargs = initargs
+        self.logger = Logger()
+
+        # Queued tasks, number of tasks being run and number of connected workers
+        self._tasks = deque()
+        self._n_running = 0
+        self._n_workers = 0
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._workers = []
+
+        self._listener = Listener((host, port), authkey=authkey.encode('utf-8'))
+        self.address = self._listener.address
+        self.logger(2, f'Waiting for workers on {self.address[0]}:{self.address[1]}')
+
+        self._accept_thread = threading.Thread(target=self._accept_workers, daemon=True)
+        self._accept_thread.start()
+
+    def submit(self, function, *args, **kwargs):
+
+        if self._shutdown:
+            raise RuntimeError('Cannot submit tasks after shutdown')
+
+        future = Future()
+        with self._condition:
+            self._tasks.append(_Task(future, function, args, kwargs))
+            self._condition.notify()
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+
+        # Workers finish the queued and requeued tasks before they close
+        with self._condition:
+            if cancel_futures:
+                while len(self._tasks) > 0:
+                    self._tasks.popleft().future.cancel()
+            self._shutdown = True
+            self._condition.notify_all()
+
+        if wait:
+            for worker in list(self._workers):
+                worker.join()
+
+        self._listener.close()
+
+        # Tasks left without workers would never finish
+        with self._condition:
+            orphans = self._pop_orphans()
+        _fail_orphans(orphans)
+
+    def _accept_workers(self):
+
+        while not self._shutdown:
+            try:
+                connection = self._listener.accept()
+            except Exception as error:
+                if self._shutdown:
+                    return
+                self.logger(2, f'Worker connection rejected: {error}')
+                continue
+
+            with self._condition:
+                self._n_workers += 1
+            worker = threading.Thread(target=self._serve_worker, args=(connection,), daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _serve_worker(self, connection):
+
+        try:
+            with connection:
+                try:
+                    connection.send(('init', self.initializer, self.initargs))
+                except OSError:
+                    return
+
+                while True:
+                    task = self._next_task()
+                    if task is None:
+                        _send_close(connection)
+                        return
+
+                    if not self._run_task(connection, task):
+                        return
+        finally:
+            with self._condition:
+                self._n_workers -= 1
+                orphans = self._pop_orphans()
+                self._condition.notify_all()
+            # The last worker of a shut down executor fails the tasks nobody else can run
+            _fail_orphans(orphans)
+
+    def _next_task(self):
+        """ Next queued task, or None once the executor is shut down and no task is queued or
+        being run (a running task is requeued if its worker disconnects)
+        """
+
+        with self._condition:
+            while True:
+                if len(self._tasks) > 0:
+                    self._n_running += 1
+                    return self._tasks.popleft()
+                if self._shutdown and self._n_running == 0:
+                    return None
+                self._condition.wait()
+
+    def _run_task(self, connection, task):
+        """ Runs a task on the worker of the connection, False if the worker was lost """
+
+        lost = False
+        try:
+            if not task.started:
+                if not task.future.set_running_or_notify_cancel():
+                    return True
+                task.started = True
+
+            try:
+                message = pickle.dumps(('task', task.function, task.args, task.kwargs))
+            except Exception as error:
+                task.future.set_exception(error)
+                return True
+
+            try:
+                connection.send_bytes(message)
+                status, value = connection.recv()
+            except (EOFError, OSError) as error:
+                self.logger(2, f'Worker lost ({error}), its task is sent to another worker')
+                lost = True
+                return False
+
+            if status == 'ok':
+                task.future.set_result(value)
+            else:
+                task.future.set_exception(value)
+            return True
+
+        finally:
+            with self._condition:
+                self._n_running -= 1
+                # Requeued tasks go first, they were submitted before the queued ones
+                if lost:
+                    self._tasks.appendleft(task)
+                self._condition.notify_all()
+
+    def _pop_orphans(self):
+        """ Queued tasks of a shut down executor without workers, called holding the condition """
+
+        if not self._shutdown or self._n_workers > 0:
+            return []
+
+        orphans = list(self._tasks)
+        self._tasks.clear()
+        return orphans
+
+
+def _fail_orphans(tasks):
+    for task in tasks:
+        if task.started or task.future.set_running_or_notify_cancel():
+            task.future.set_exception(RuntimeError('The executor was shut down with no worker left to run the task'))
+
+
+def _send_close(connection):
+    try:
+        connection.send(('close',))
+    except OSError:
+        pass
+
+
+def run_worker(host='localhost', port=DEFAULT_PORT, authkey=None, reconnect=True, timeout=None, retry_interval=1.0):
+    """ Connects to a SocketExecutor coordinator and runs its tasks until it closes. With reconnect the
+    worker then waits for the next coordinator, giving up after timeout seconds without one.
+    """
+
+    logger = Logger()
+    authkey = authkey.encode('utf-8') if authkey is not None else None
+
+    waiting_since = time.monotonic()
+    while True:
+        try:
+            connection = Client((host, int(port)), authkey=authkey)
+        except (ConnectionRefusedError, FileNotFoundError):
+            if timeout is not None and time.monotonic() - waiting_since > timeout:
+                logger(1, f'No coordinator in {timeout} seconds, stopping worker {os.getpid()}')
+                return
+            time.sleep(retry_interval)
+            continue
+
+        logger(1, f'Worker {os.getpid()} connected to {host}:{port}')
+        with connection:
+            _run_tasks(connection, logger)
+
+        if not reconnect:
+            return
+        waiting_since = time.monotonic()
+
+
+def _run_tasks(connection, logger):
+
+    while True:
+        try:
+            message_bytes = connection.recv_bytes()
+        except (EOFError, OSError):
+            return
+
+        try:
+            message = pickle.loads(message_bytes)
+        except Exception as error:
+            # Tasks whose function or arguments can not be imported here fail instead of being requeued
+            logger(1, traceback.format_exc())
+            connection.send(('error', RuntimeError(
+                f'Worker {os.getpid()} could not load its task: {error}'
+            )))
+            continue
+
+        if message[0] == 'close':
+            return
+
+        if message[0] == 'init':
+            _, initializer, initargs = message
+            if initializer is not None:
+                initializer(*initargs)
+            continue
+
+        _, function, args, kwargs = message
+        logger(2, f'Running {getattr(function, "__qualname__", function)}')
+        try:
+            response = ('ok', function(*args, **kwargs))
+        except Exception as error:
+            logger(1, traceback.format_exc())
+            response = ('error', error)
+
+        try:
+            connection.send(response)
+        except Exception as error:
+            # Results or exceptions that can not be pickled are sent as an error with their traceback
+            connection.send(('error', RuntimeError(
+                f'Worker {os.getpid()} could not send its result: {error}\n{traceback.format_exc()}'
+            )))
@@ -0,0 +1,19 @@
+import numpy as np
+
+
+def num_samples(data):
+    """ Number of rows of an array, DataFrame or list """
+    if hasattr(data, 'shape'):
+        return data.shape[0]
+    return len(data)
+
+
+def take(data, indices):
+    """ Rows of an array, DataFrame (by position) or list at indices, a slice or an index array.
+    Arrays (and memory maps) are indexed directly, so slices are views of the data.
+    """
+    if hasattr(data, 'iloc'):
+        return data.iloc[indices]
+    if hasattr(data, 'shape'):
+        return data[indices]
+    return np.asarray(data)[indices]
@@ -0,0 +1,145 @@
+import numpy as np
+from sklearn.utils.multiclass import type_of_target, unique_labels
+
+from ConPipe.exceptions import NotSharedMetricError
+
+
+class ConfusionStats():
+    """ Label encoding and confusion matrix of a y_true/y_pred pair computed
+    once and shared by all the pred scores that can be derived from them
+    """
+
+    def __init__(self, y_true, y_pred):
+
+        for y in (y_true, y_pred):
+            if type_of_target(y) not in ('binary', 'multiclass'):
+                raise NotSharedMetricError('Only binary and multiclass targets are supported')
+
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+
+        self.labels = unique_labels(y_true, y_pred)
+        n_labels = len(self.labels)
+
+        true_idx = np.searchsorted(self.labels, y_true)
+        pred_idx = np.searchsorted(self.labels, y_pred)
+
+        self.matrix = np.bincount(
+            true_idx * n_labels + pred_idx,
+            minlength=n_labels * n_labels
+        ).reshape(n_labels, n_labels)
+
+        self.tp_sum = np.diag(self.matrix)
+        self.true_sum = self.matrix.sum(axis=1)
+        self.pred_sum = self.matrix.sum(axis=0)
+
+
+def confusion_matrix(stats, **parameters):
+    _check_no_parameters(parameters)
+    return stats.matrix
+
+
+def accuracy_score(stats, normalize=True, **parameters):
+    _check_no_parameters(parameters)
+
+    if not normalize:
+        return stats.tp_sum.sum()
+
+    return stats.tp_sum.sum() / stats.matrix.sum()
+
+
+def precision_score(stats, **parameters):
+    precision, _, _ = _precision_recall_fscore(stats, 1, **parameters)
+    return precision
+
+
+def recall_score(stats, **parameters):
+    _, recall, _ = _precision_recall_fscore(stats, 1, **parameters)
+    return recall
+
+
+def f1_score(stats, **parameters):
+    _, _, f_score = _precision_recall_fscore(stats, 1, **parameters)
+    return f_score
+
+
+def fbeta_score(stats, beta, **parameters):
+    _, _, f_score = _precision_recall_fscore(stats, beta, **parameters)
+    return f_score
+
+
+# sklearn.metrics functions that can be computed from ConfusionStats
+SHARED_METRICS = {
+    'confusion_matrix': confusion_matrix,
+    'accuracy_score': accuracy_score,
+    'precision_score': precision_score,
+    'recall_score': recall_score,
+    'f1_score': f1_score,
+    'fbeta_score': fbeta_score
+}
+
+
+def get_shared_metric(function):
+    if not getattr(function, '__module__', '').startswith('sklearn.metrics'):
+        return None
+    return SHARED_METRICS.get(getattr(function, '__name__', None), None)
+
+
+# Same formulas as sklearn.metrics.precision_recall_fscore_support. Cases where
+# sklearn warns or sets zero_division values are left to the sklearn functions.
+def _precision_recall_fscore(stats, beta, average='binary', pos_label=1, zero_division='warn', **parameters):
+
+    _check_no_parameters(parameters)
+
+    tp_sum = stats.tp_sum
+    pred_sum = stats.pred_sum
+    true_sum = stats.true_sum
+
+    if average == 'binary':
+        if len(stats.labels) > 2 or pos_label not in stats.labels:
+            raise NotSharedMetricError('Binary average needs a binary target with pos_label')
+
+        label_idx = [int(np.searchsorted(stats.labels, pos_label))]
+        tp_sum, pred_sum, true_sum = tp_sum[label_idx], pred_sum[label_idx], true_sum[label_idx]
+
+    elif average == 'micro':
+        tp_sum = np.array([tp_sum.sum()])
+        pred_sum = np.array([pred_sum.sum()])
+        true_sum = np.array([true_sum.sum()])
+
+    elif average not in ('macro', 'weighted', None):
+        raise NotSharedMetricError(f'Average {average} is not supported')
+
+    if (pred_sum == 0).any() or (true_sum == 0).any():
+        raise NotSharedMetricError('Ill defined scores are left to sklearn')
+
+    precision = tp_sum / pred_sum
+    recall = tp_sum / true_sum
+
+    beta2 = beta ** 2
+    if np.isposinf(beta):
+        f_score = recall
+    elif beta == 0:
+        f_score = precision
+    else:
+        denom = beta2 * precision + recall
+        mask = np.isclose(denom, 0)
+        denom[mask] = 1
+        f_score = (1 + beta2) * precision * recall / denom
+        f_score[mask] = 0.0 if zero_division == 'warn' else float(zero_division)
+
+    if average is None:
+        return precision, recall, f_score
+
+    weights = true_sum if average == 'weighted' else None
+    return (
+        np.average(precision, weights=weights),
+        np.average(recall, weights=weights),
+        np.average(f_score, weights=weights)
+    )
+
+
+# Any other parameter (e.g. labels or sample_weight) is left to the sklearn functions
+def _check_no_parameters(parameters):
+    for name in parameters.keys():
+        raise NotSharedMetricError(f'Parameter {name} is not supported')
@@ -0,0 +1,82 @@
+import cProfile
+import io
+import pstats
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is not recorded there
+    resource = None
+
+
+def peak_rss():
+    """ Peak resident set size of this process in bytes, or None if it can not be measured """
+    if resource is None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def run_profiled(function, args, kwargs, profile_file=None, thread_cpu=False):
+    """ Runs function(*args, **kwargs) and returns its result together with its wall time, CPU
+    time and how much it raised the process peak RSS. If profile_file is set the call is run
+    under cProfile and its stats are dumped to that file. The CPU time is the one of the whole
+    process, or with thread_cpu only the one of the calling thread, for calls that run at the
+    same time as others in the same process.
+    """
+
+    cpu_clock = time.thread_time if thread_cpu else time.process_time
+
+    rss_before = peak_rss()
+    cpu_start = cpu_clock()
+    wall_start = time.perf_counter()
+
+    if profile_file is not None:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(function, *args, **kwargs)
+        profiler.dump_stats(profile_file)
+    else:
+        result = function(*args, **kwargs)
+
+    stats = {
+        'wall_time': time.perf_counter() - wall_start,
+        'cpu_time': cpu_clock() - cpu_start,
+        'peak_rss_delta': peak_rss() - rss_before if rss_before is not None else None
+    }
+
+    return result, stats
+
+
+def profile_report(profile_file, sort='cumulative', lines=20):
+    stream = io.StringIO()
+    pstats.Stats(profile_file, stream=stream).sort_stats(sort).print_stats(int(lines))
+    return stream.getvalue()
+
+
+def profile_table(profiles):
+    """ Summary table of the {node_name: profile} run state profiles """
+    import pandas as pd
+
+    rows = []
+    for node_name, profile in profiles.items():
+        outputs = profile.get('outputs', {})
+        rows.append({
+            'node': node_name,
+            'wall_s': profile.get('wall_time', None),
+            'cpu_s': profile.get('cpu_time', None),
+            'peak_rss_mb': _megabytes(profile.get('peak_rss_delta', None)),
+            'input_s': profile.get('input_time', None),
+            'save_s': profile.get('save_time', None),
+            'output_mb': _megabytes(sum(output.get('size', 0) for output in outputs.values())),
+            'load_s': sum((output.get('load_time', 0.0) for output in outputs.values()), 0.0)
+        })
+
+    return pd.DataFrame(rows).to_string(index=False, float_format=lambda value: f'{value:.3f}', na_rep='-')
+
+
+def _megabytes(n_bytes):
+    return n_bytes / 2 ** 20 if n_bytes is not None else None
@@ -0,0 +1,222 @@
+import pickle
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from ConPipe.Logger import Logger
+
+# Buffers smaller than this are copied inside the pickled task
+MIN_SHARED_SIZE = 1 << 16
+
+# Segments attached in this process, by name, and closed segments whose memory is still in use
+_attached = {}
+_closing = []
+_attached_lock = threading.Lock()
+
+
+def uses_shared_memory(executor_config):
+    """ Whether an executor config asks for the shared memory transport, which
+    is only possible with workers on the same machine
+    """
+
+    if executor_config is None or not executor_config.get('shared_memory', False):
+        return False
+
+    if executor_config.get('type', None) != 'process':
+        raise ValueError('The shared_memory transport is only available with the process executor')
+
+    return True
+
+
+class SharedValue():
+    """ Picklable handle of a value whose large buffers (numpy arrays, DataFrame
+    blocks) are in shared memory segments, only the rest of the value is pickled
+    """
+
+    def __init__(self, payload, segments):
+        self.payload = payload
+        self.segments = segments
+
+    def load(self):
+        # Values are read only, so a process can not change the data other processes see
+        buffers = [
+            _attach(name).buf[:n_bytes].toreadonly()
+            for name, n_bytes in self.segments
+        ]
+        return pickle.loads(self.payload, buffers=buffers)
+
+
+class SharedMemoryTransport():
+    """ Places the large buffers of the values sent to worker processes in shared memory
+    segments. The same buffer is placed only once and its segment lives until every
+    owner (e.g. the node whose output has the buffer) is released.
+    """
+
+    def __init__(self, min_size=MIN_SHARED_SIZE):
+        self.min_size = min_size
+        self.logger = Logger()
+
+        # Worker processes started after this share the segments tracker of this process,
+        # which would otherwise report the segments it did not create as leaked
+        resource_tracker.ensure_running()
+
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._addresses = {}
+
+    def share(self, value, owner):
+
+        segments = []
+
+        def buffer_callback(buffer):
+            with buffer.raw() as data:
+                n_bytes = data.nbytes
+            if n_bytes < self.min_size:
+                return True
+            segments.append((self._segment(buffer, owner), n_bytes))
+            return False
+
+        payload = pickle.dumps(value, protocol=5, buffer_callback=buffer_callback)
+        return SharedValue(payload, segments)
+
+    def adopt(self, shared_value, owner):
+        """ Loads a value shared by a worker and takes over its segments """
+
+        value = shared_value.load()
+
+        with self._lock, _attached_lock:
+            for name, n_bytes in shared_value.segments:
+                shared_memory = _attached.pop(name)
+                self._segments[name] = {
+                    'shared_memory': shared_memory,
+                    'owners': {owner},
+                    'source': None,
+                    'address': (_address(shared_memory.buf[:n_bytes]), n_bytes)
+                }
+                self._addresses[self._segments[name]['address']] = name
+
+        return value
+
+    def release(self, owner):
+        """ Removes an owner from its segments and frees the segments left without owners """
+
+        with self._lock:
+            for name in list(self._segments.keys()):
+                segment = self._segments[name]
+                segment['owners'].discard(owner)
+                if len(segment['owners']) == 0:
+                    self._free(name)
+
+        release_attached()
+
+    def close(self):
+
+        with self._lock:
+            for name in list(self._segments.keys()):
+                self._free(name)
+
+        release_attached()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _segment(self, buffer, owner):
+
+        with buffer.raw() as data:
+            address = (_address(data), data.nbytes)
+
+            with self._lock:
+                name = self._addresses.get(address, None)
+                if name is None:
+                    shared_memory = SharedMemory(create=True, size=data.nbytes)
+                    shared_memory.buf[:data.nbytes] = data
+                    name = shared_memory.name
+
+                    # The source buffer is kept so its address is not reused while the segment exists
+                    self._segments[name] = {
+                        'shared_memory': shared_memory,
+                        'owners': set(),
+                        'source': buffer,
+                        'address': address
+                    }
+                    self._addresses[address] = name
+                    self.logger(6, f'Shared {data.nbytes} bytes in segment {name}')
+
+                self._segments[name]['owners'].add(owner)
+
+        return name
+
+    def _free(self, name):
+
+        segment = self._segments.pop(name)
+        del self._addresses[segment['address']]
+
+        # The memory of unlinked segments stays valid in the processes that still map it
+        segment['shared_memory'].unlink()
+        _close(segment['shared_memory'])
+        self.logger(6, f'Freed segment {name}')
+
+
+def load_shared(value):
+    return value.load() if isinstance(value, SharedValue) else value
+
+
+def export_value(value, min_size=MIN_SHARED_SIZE):
+    """ Shares a value from a worker process. Its segments are not freed here, the process
+    that loads the value must adopt them (see SharedMemoryTransport.adopt).
+    """
+
+    segments = []
+
+    def buffer_callback(buffer):
+        with buffer.raw() as data:
+            if data.nbytes < min_size:
+                return True
+
+            shared_memory = SharedMemory(create=True, size=data.nbytes)
+            shared_memory.buf[:data.nbytes] = data
+            segments.append((shared_memory.name, data.nbytes))
+            _close(shared_memory)
+        return False
+
+    payload = pickle.dumps(value, protocol=5, buffer_callback=buffer_callback)
+    return SharedValue(payload, segments)
+
+
+def release_attached():
+    """ Closes the attached segments that no value of this process uses anymore """
+
+    with _attached_lock:
+        # A partially closed segment can not be used again, so the ones still in use wait in _closing
+        for name in list(_attached.keys()):
+            _close(_attached.pop(name))
+
+        for shared_memory in list(_closing):
+            if _close(shared_memory):
+                _closing.remove(shared_memory)
+
+
+def _attach(name):
+    with _attached_lock:
+        if name not in _attached:
+            _attached[name] = SharedMemory(name=name)
+        return _attached[name]
+
+
+def _close(shared_memory):
+    try:
+        shared_memory.close()
+        return True
+    except BufferError:
+        # Some value still uses the segment memory
+        if shared_memory not in _closing:
+            _closing.append(shared_memory)
+        return False
+
+
+def _address(data):
+    import numpy as np
+    return int(np.frombuffer(data, dtype=np.uint8).ctypes.data)
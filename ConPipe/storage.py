@@ -0,0 +1,564 @@
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import uuid
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, directory locks are not taken there
+    fcntl = None
+
+# numpy and pandas are imported by the storage types that use them, so
+# indexing cached outputs and json or pickle outputs do not import them
+
+
+MANIFEST_FILE = 'manifest.json'
+
+# File extension used to store the outputs of each storage type
+STORAGE_EXTENSIONS = {
+    'json': 'json',
+    'csv': 'csv',
+    'npy': 'npy',
+    'npy_mmap': 'npy',
+    'pickle': 'pickle',
+    'pickle5': 'pickle5',
+    'parquet': 'parquet',
+    'feather': 'feather'
+}
+
+# Default compression of the columnar storage types
+DEFAULT_COMPRESSIONS = {
+    'parquet': 'snappy',
+    'feather': 'lz4'
+}
+
+# Schema metadata key of the columns that parquet and feather files store as JSON strings
+JSON_COLUMNS_KEY = b'conpipe.json_columns'
+
+# Storage types whose loaded values are read only memory maps of the saved files
+MMAP_STORAGE_TYPES = ('npy_mmap',)
+
+# Storage types whose large buffers (e.g. numpy arrays) are saved out of band in a <output>.buffers file
+OUT_OF_BAND_STORAGE_TYPES = ('pickle5',)
+
+BUFFERS_EXTENSION = 'buffers'
+
+# Compressions of the pickle5 storage type, lz4 and zstd require pyarrow
+PICKLE5_COMPRESSIONS = ('zlib', 'lz4', 'zstd')
+
+# Default size of the smallest buffer saved out of band, smaller ones are kept inside the pickle stream.
+# The node arrays of each tree of forests and boosting models are a few KiB at most.
+MIN_OUT_OF_BAND_SIZE = 512
+
+# Offsets of the buffers in their file are aligned so memory mapped arrays are aligned too
+BUFFER_ALIGNMENT = 64
+
+# Files of the output directory that are not node outputs
+RESERVED_FILES = (MANIFEST_FILE, 'run_state.json')
+
+LOCK_FILE = '.lock'
+
+# Directory extension of the chunk files of streamed outputs
+CHUNKS_EXTENSION = 'chunks'
+
+
+def output_file_name(output_name, storage_type):
+
+    if storage_type not in STORAGE_EXTENSIONS:
+        raise ValueError(
+            f'Storage type {storage_type} non existent, options are: '
+            + ', '.join(STORAGE_EXTENSIONS.keys())
+        )
+
+    return f'{output_name}.{STORAGE_EXTENSIONS[storage_type]}'
+
+
+def save_value(value, path, storage_type, pandas_sep=';', options=None):
+    """ Saves value to path and returns the save stats of the storage type (or an empty dict) """
+
+    # Readers never see a partially written file
+    with atomic_path(path) as temp_path:
+        if storage_type in OUT_OF_BAND_STORAGE_TYPES:
+            return _save_pickle5(value, temp_path, buffers_path(path), options)
+
+        _save_value(value, temp_path, storage_type, pandas_sep, options)
+        return {}
+
+
+def _save_value(value, path, storage_type, pandas_sep=';', options=None):
+
+    options = options if options is not None else {}
+
+    if storage_type == 'json':
+        with open(path, 'w', encoding='utf-8') as json_file:
+            json.dump(value, json_file, indent=2)
+
+    elif storage_type == 'csv':
+        value.to_csv(
+            path,
+            sep=pandas_sep,
+            index=False,
+            encoding='utf-8'
+        )
+
+    elif storage_type in ('npy', 'npy_mmap'):
+        import numpy as np
+        np.save(path, value)
+
+    elif storage_type == 'pickle':
+        with open(path, 'wb') as pickle_file:
+            pickle.dump(value, pickle_file)
+
+    elif storage_type in ('parquet', 'feather'):
+        _save_arrow(value, path, storage_type, options)
+
+
+def load_value(path, storage_type, pandas_sep=';', options=None):
+
+    options = options if options is not None else {}
+
+    if storage_type == 'json':
+        with open(path, 'r', encoding='utf-8') as json_file:
+            return json.load(json_file)
+
+    if storage_type == 'csv':
+        import pandas as pd
+        return pd.read_csv(
+            path,
+            sep=pandas_sep,
+            encoding='utf-8'
+        )
+
+    if storage_type == 'npy':
+        import numpy as np
+        return np.load(path)
+
+    if storage_type == 'npy_mmap':
+        import numpy as np
+        return np.load(path, mmap_mode='r')
+
+    if storage_type == 'pickle':
+        with open(path, 'rb') as pickle_file:
+            return pickle.load(pickle_file)
+
+    if storage_type == 'pickle5':
+        return _load_pickle5(path, options)
+
+    if storage_type in ('parquet', 'feather'):
+        return _load_arrow(path, storage_type, options)
+
+    raise ValueError(f'Storage type {storage_type} non existent')
+
+
+# Whether saved values must be replaced by the loaded ones so consumers get the same value from memory or cache
+def reload_after_save(storage_type, options=None):
+    options = options if options is not None else {}
+    return storage_type in MMAP_STORAGE_TYPES \
+        or options.get('columns', None) is not None \
+        or (storage_type in OUT_OF_BAND_STORAGE_TYPES and _pickle5_mmap(options))
+
+
+def buffers_path(path):
+    return f'{os.path.splitext(path)[0]}.{BUFFERS_EXTENSION}'
+
+
+def output_files(path, storage_type):
+    """ Paths of all the files of an output saved to path """
+    if storage_type in OUT_OF_BAND_STORAGE_TYPES:
+        return [path, buffers_path(path)]
+    return [path]
+
+
+def _save_pickle5(value, path, buffers_file, options):
+
+    options = options if options is not None else {}
+    compression = options.get('compression', None)
+    compression_level = options.get('compression_level', None)
+    compress, _ = _pickle5_codec(compression, compression_level)
+    min_buffer_size = int(options.get('min_buffer_size', MIN_OUT_OF_BAND_SIZE))
+
+    # Contiguous buffers (numpy arrays) are not copied into the pickle stream,
+    # the callback returns False for the buffers that are saved out of band
+    buffers = []
+
+    def buffer_callback(buffer):
+        with buffer.raw() as data:
+            if data.nbytes < min_buffer_size:
+                return True
+        buffers.append(buffer)
+        return False
+
+    payload = pickle.dumps(value, protocol=5, buffer_callback=buffer_callback)
+
+    # The buffers file starts with a token that the pickle file must match, so an
+    # interrupted save never pairs a pickle with the buffers of another save
+    token = uuid.uuid4().bytes
+    buffer_entries = []
+    raw_size = len(payload)
+    with atomic_path(buffers_file) as temp_buffers_file:
+        with open(temp_buffers_file, 'wb') as file:
+            file.write(token)
+            for buffer in buffers:
+                data = buffer.raw()
+                raw_size += data.nbytes
+
+                offset = _align(file.tell())
+                file.seek(offset)
+                stored = compress(data) if compress is not None else data
+                file.write(stored)
+                buffer_entries.append((offset, len(stored), data.nbytes))
+
+            buffers_size = file.tell()
+
+    header = {
+        'token': token,
+        'compression': compression,
+        'payload_size': len(payload),
+        'buffers': buffer_entries,
+        'buffers_size': buffers_size
+    }
+    with open(path, 'wb') as file:
+        pickle.dump(header, file, protocol=5)
+        file.write(compress(payload) if compress is not None else payload)
+
+    return {
+        'raw_size': raw_size,
+        'out_of_band_buffers': len(buffer_entries)
+    }
+
+
+def _load_pickle5(path, options):
+
+    options = options if options is not None else {}
+    with open(path, 'rb') as file:
+        header = pickle.load(file)
+        payload = file.read()
+
+    _, decompress = _pickle5_codec(header['compression'])
+    if decompress is not None:
+        payload = decompress(payload, header['payload_size'])
+
+    buffers_file = buffers_path(path)
+    if os.path.getsize(buffers_file) != header['buffers_size']:
+        raise ValueError(f'Buffers file {buffers_file} does not belong to {path}')
+
+    with open(buffers_file, 'rb') as file:
+        if file.read(len(header['token'])) != header['token']:
+            raise ValueError(f'Buffers file {buffers_file} does not belong to {path}')
+
+        if decompress is None and _pickle5_mmap(options):
+            # The loaded arrays are read only views of the page cache
+            data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            buffers = [data[offset:offset + size] for offset, size, _ in header['buffers']]
+        else:
+            buffers = []
+            for offset, size, raw_size in header['buffers']:
+                file.seek(offset)
+                if decompress is not None:
+                    buffers.append(bytearray(decompress(file.read(size), raw_size)))
+                else:
+                    buffer = bytearray(size)
+                    file.readinto(buffer)
+                    buffers.append(buffer)
+
+    return pickle.loads(payload, buffers=buffers)
+
+
+def _pickle5_mmap(options):
+    # Compressed buffers can not be memory mapped
+    return options.get('mmap', True) and options.get('compression', None) is None
+
+
+def _align(offset):
+    return -(-offset // BUFFER_ALIGNMENT) * BUFFER_ALIGNMENT
+
+
+def _pickle5_codec(compression, compression_level=None):
+    """ (compress(data), decompress(data, raw_size)) functions of a compression, None without compression """
+
+    if compression is None:
+        return None, None
+
+    if compression == 'zlib':
+        level = int(compression_level) if compression_level is not None else 1
+        return (
+            lambda data: zlib.compress(data, level),
+            lambda data, raw_size: zlib.decompress(data, bufsize=max(raw_size, 1))
+        )
+
+    if compression in ('lz4', 'zstd'):
+        import pyarrow as pa
+        codec = pa.Codec(
+            compression,
+            compression_level=int(compression_level) if compression_level is not None else None
+        )
+        return (
+            lambda data: codec.compress(data, asbytes=True),
+            lambda data, raw_size: codec.decompress(data, raw_size, asbytes=True)
+        )
+
+    raise ValueError(
+        f'Compression {compression} non existent, options are: '
+        + ', '.join(PICKLE5_COMPRESSIONS)
+    )
+
+
+def _save_arrow(value, path, storage_type, options):
+
+    import pyarrow as pa
+
+    # Arrow columns have a single type, so object columns with dicts, lists or mixed types
+    # (e.g. the params and param_* columns of cv_results_) are stored as JSON strings
+    json_columns = _json_columns(value)
+    if len(json_columns) > 0:
+        value = value.copy(deep=False)
+        for column in json_columns:
+            value[column] = _encode_json_column(value[column], column)
+
+    # Only the default index is stored
+    table = pa.Table.from_pandas(value, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        JSON_COLUMNS_KEY: json.dumps([str(column) for column in json_columns]).encode('utf-8')
+    })
+
+    if storage_type == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, **_compression_parameters(storage_type, options))
+    else:
+        from pyarrow import feather
+        feather.write_feather(table, path, **_compression_parameters(storage_type, options))
+
+
+def _load_arrow(path, storage_type, options):
+
+    columns = options.get('columns', None)
+    if storage_type == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns)
+    else:
+        from pyarrow import feather
+        table = feather.read_table(path, columns=columns)
+
+    import pandas as pd
+
+    # Columns are returned in the requested order, feather returns them in their file order
+    value = table.to_pandas()
+    if columns is not None:
+        value = value[list(columns)]
+
+    json_columns = json.loads((table.schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]'))
+    for column in json_columns:
+        if column in value.columns:
+            # Decoded values keep their own types, e.g. int and float parameters of the same column
+            value[column] = pd.Series(
+                [json.loads(item) if item is not None else None for item in value[column]],
+                index=value.index,
+                dtype=object
+            )
+
+    return value
+
+
+def _json_columns(value):
+    """ Object columns of a DataFrame whose values are not all of the same scalar type """
+
+    import numpy as np
+
+    json_columns = []
+    for column in value.columns:
+        if value[column].dtype != object:
+            continue
+
+        # Missing values are stored as nulls in any column
+        kinds = set()
+        for item in value[column]:
+            if item is None or (isinstance(item, float) and np.isnan(item)):
+                continue
+            kinds.add(_scalar_kind(item))
+
+        if len(kinds) > 1 or None in kinds:
+            json_columns.append(column)
+
+    return json_columns
+
+
+def _scalar_kind(item):
+    """ Arrow type family of a scalar value, None for the values Arrow can not store in a column of their own """
+
+    import numbers
+    for kind in (str, bytes, bool, numbers.Integral, numbers.Real):
+        if isinstance(item, kind):
+            return kind
+    return None
+
+
+def _encode_json_column(series, column):
+
+    def encode(item):
+        if item is None:
+            return None
+        try:
+            return json.dumps(item, default=_json_default)
+        except (TypeError, ValueError) as error:
+            raise ValueError(
+                f'Column {column} can not be saved as parquet or feather, its value {item!r} '
+                f'is not JSON serializable: {error}'
+            ) from error
+
+    return series.map(encode)
+
+
+def _json_default(item):
+    # numpy scalars and arrays (e.g. of the param_* values of cv_results_)
+    if hasattr(item, 'tolist'):
+        return item.tolist()
+    raise TypeError(f'Object of type {type(item).__name__} is not JSON serializable')
+
+
+def _compression_parameters(storage_type, options):
+
+    parameters = {
+        'compression': options.get('compression', DEFAULT_COMPRESSIONS[storage_type])
+    }
+    if options.get('compression_level', None) is not None:
+        parameters['compression_level'] = int(options['compression_level'])
+
+    return parameters
+
+
+def file_checksum(paths, chunk_size=1 << 20):
+    """ Checksum of the contents of a file or of a list of files """
+    paths = [paths] if isinstance(paths, str) else paths
+
+    hasher = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# Checksums read the saved files again, so they are only computed when they are verified on load
+def manifest_entry(output_dir, file_name, storage_type, checksum=False):
+    paths = output_files(os.path.join(output_dir, file_name), storage_type)
+    return {
+        'file': file_name,
+        'format': storage_type,
+        'size': output_size(paths),
+        'checksum': file_checksum(paths) if checksum else None
+    }
+
+
+def output_size(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def chunk_path(output_dir, output_name, storage_type, chunk_idx):
+    return os.path.join(
+        output_dir,
+        f'{output_name}.{CHUNKS_EXTENSION}',
+        output_file_name(f'{chunk_idx:06d}', storage_type)
+    )
+
+
+def chunks_manifest_entry(output_dir, output_name, storage_type, n_chunks, checksum=False):
+    """ Manifest entry of a streamed output saved as n_chunks chunk files """
+
+    chunk_paths = [
+        chunk_path(output_dir, output_name, storage_type, chunk_idx)
+        for chunk_idx in range(n_chunks)
+    ]
+    paths = [path for chunk in chunk_paths for path in output_files(chunk, storage_type)]
+
+    return {
+        'file': f'{output_name}.{CHUNKS_EXTENSION}',
+        'format': storage_type,
+        'chunks': [os.path.relpath(path, output_dir) for path in chunk_paths],
+        'size': output_size(paths),
+        'checksum': file_checksum(paths) if checksum else None
+    }
+
+
+def write_manifest(output_dir, manifest):
+    write_json(os.path.join(output_dir, MANIFEST_FILE), manifest, indent=2)
+
+
+def write_json(path, value, **json_parameters):
+    with atomic_path(path) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8') as json_file:
+            json.dump(value, json_file, **json_parameters)
+
+
+@contextmanager
+def atomic_path(path):
+    """ Temporary path in the same directory (keeping the file extension) that
+    replaces path when the block finishes without errors
+    """
+    directory, file_name = os.path.split(path)
+    temp_path = os.path.join(directory, f'.{uuid.uuid4().hex}.{file_name}')
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@contextmanager
+def directory_lock(directory):
+    """ Exclusive lock of a directory between processes """
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_manifest(output_dir):
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+
+    return scan_output_dir(output_dir)
+
+
+# Builds the manifest of output directories saved before manifests existed
+def scan_output_dir(output_dir):
+
+    # Extensions shared by several storage types are read with the first one
+    formats = {}
+    for storage_type, extension in STORAGE_EXTENSIONS.items():
+        formats.setdefault(extension, storage_type)
+
+    manifest = {}
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            # Hidden files are locks or temporary files of unfinished writes
+            if not entry.is_file() or entry.name in RESERVED_FILES or entry.name.startswith('.'):
+                continue
+
+            output_name, _, extension = entry.name.rpartition('.')
+            if extension not in formats:
+                continue
+
+            manifest[output_name] = {
+                'file': entry.name,
+                'format': formats[extension],
+                'size': output_size(output_files(entry.path, formats[extension])),
+                'checksum': None
+            }
+
+    return manifest
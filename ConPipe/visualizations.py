@@ -1,67 +1,203 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import roc_curve, auc, confusion_matrix
+from sklearn.metrics import auc, confusion_matrix
 import numpy as np
 
-def roc_chart_binary(y_true, y_pred, y_probas, classes, class_labels):
+# Temporary memory of the ROC curves of a batch of classes: bytes per score (sort order, sorted
+# scores, labels, positives and their cumsum) and default limit of a batch
+ROC_BYTES_PER_SCORE = 48
+ROC_BATCH_MEMORY = 256 * 2 ** 20
+
+
+def roc_curves(y_true, y_probas, classes, method='exact', n_bins=1000, max_points=500,
+               class_batch_size=None, batch_memory=ROC_BATCH_MEMORY):
+    """ One vs rest ROC curves of all the classes (y_probas[:, i] are the scores of classes[i]).
+    method='exact' sorts the scores once per class column, method='histogram' approximates
+    the curves counting the scores in n_bins fixed bins, which is linear in the number of samples.
+    Curves are downsampled to at most max_points, the AUCs are calculated before downsampling.
+    Classes are processed in batches of class_batch_size columns, by default as many as fit
+    in batch_memory bytes of temporary arrays (at least one).
+    :return: list of fpr arrays, list of tpr arrays and array of AUC values, one per class
+    """
+
+    if method not in ('exact', 'histogram'):
+        raise ValueError(f'ROC method {method} non existent, options are: exact, histogram')
+
+    y_true = np.asarray(y_true)
+    y_probas = np.asarray(y_probas)
+    classes = np.asarray(classes)
+
+    if class_batch_size is None:
+        class_batch_size = int(batch_memory) // max(len(y_true) * ROC_BYTES_PER_SCORE, 1)
+    class_batch_size = max(1, min(int(class_batch_size), len(classes)))
+
+    fprs, tprs, aucs = [], [], []
+    for start in range(0, len(classes), class_batch_size):
+        batch = slice(start, start + class_batch_size)
+
+        if method == 'exact':
+            batch_curves = _exact_roc_curves(y_true, y_probas[:, batch], classes[batch])
+        else:
+            batch_curves = _histogram_roc_curves(y_true, y_probas[:, batch], classes[batch], int(n_bins))
+
+        for fpr, tpr in batch_curves:
+            aucs.append(auc(fpr, tpr) if len(fpr) > 1 else np.nan)
+            fpr, tpr = _downsample_curve(fpr, tpr, max_points)
+            fprs.append(fpr)
+            tprs.append(tpr)
+
+    return fprs, tprs, np.array(aucs)
+
+
+def _exact_roc_curves(y_true, y_probas, classes):
+
+    n_samples = y_probas.shape[0]
+
+    # Sort every class column at once and accumulate the positives over the thresholds
+    order = np.argsort(-y_probas, axis=0, kind='stable')
+    sorted_scores = np.take_along_axis(y_probas, order, axis=0)
+    tps_all = np.cumsum(y_true[order] == classes[np.newaxis, :], axis=0)
+
+    curves = []
+    for i in range(len(classes)):
+        # Only the last sample of each distinct score is a threshold
+        thresholds_idx = np.r_[np.flatnonzero(np.diff(sorted_scores[:, i])), n_samples - 1]
+        tps = tps_all[thresholds_idx, i]
+        fps = thresholds_idx + 1 - tps
+        curves.append(_rates(tps, fps))
+
+    return curves
+
+
+def _histogram_roc_curves(y_true, y_probas, classes, n_bins):
+
+    n_classes = len(classes)
+
+    # Bin of each score, offset by class so all the class histograms are counted together
+    bins = np.clip((y_probas * n_bins).astype(np.int64), 0, n_bins - 1)
+    bins += np.arange(n_classes)[np.newaxis, :] * n_bins
+    positives = y_true[:, np.newaxis] == classes[np.newaxis, :]
+
+    counts = np.bincount(bins.ravel(), minlength=n_classes * n_bins).reshape(n_classes, n_bins)
+    pos_counts = np.bincount(
+        bins.ravel(),
+        weights=positives.ravel(),
+        minlength=n_classes * n_bins
+    ).reshape(n_classes, n_bins)
+
+    # Thresholds go from the highest to the lowest bin
+    tps_all = np.cumsum(pos_counts[:, ::-1], axis=1)
+    fps_all = np.cumsum((counts - pos_counts)[:, ::-1], axis=1)
+
+    return [_rates(tps_all[i], fps_all[i]) for i in range(n_classes)]
+
+
+def _rates(tps, fps):
+    tps = np.r_[0, tps]
+    fps = np.r_[0, fps]
+
+    # Classes without positives or negatives have an undefined rate, as in sklearn
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return fps / fps[-1], tps / tps[-1]
+
+
+def _downsample_curve(fpr, tpr, max_points):
+
+    if max_points is None or len(fpr) <= max_points:
+        return fpr, tpr
+
+    idx = np.unique(np.linspace(0, len(fpr) - 1, int(max_points)).round().astype(int))
+    return fpr[idx], tpr[idx]
+
+
+def roc_chart_binary(y_true, y_pred, y_probas, classes, class_labels, ax=None,
+                     method='exact', n_bins=1000, max_points=500):
+
+    ax = ax if ax is not None else _current_axis()
 
     if len(classes) != 2:
         raise ValueError('classes must be arrays with 2 elements')
 
-    fpr, tpr, _ = roc_curve((y_true == classes[1]).astype(int), y_probas[:, 1])
-    roc_auc = auc(fpr, tpr)
+    fpr, tpr, roc_auc = roc_curves(
+        y_true,
+        np.asarray(y_probas)[:, 1:2],
+        np.asarray(classes)[1:2],
+        method=method,
+        n_bins=n_bins,
+        max_points=max_points
+    )
 
     # Plot of a ROC curve for a specific class
-    plt.plot([0, 1], [0, 1], 'k--')
-    plt.plot(
-        fpr,
-        tpr,
-        label=f'AUC = {str(roc_auc)[:4]}'
+    ax.plot([0, 1], [0, 1], 'k--')
+    ax.plot(
+        fpr[0],
+        tpr[0],
+        label=f'AUC = {str(roc_auc[0])[:4]}'
     )
     
-    plt.xlabel('False Positive Rate', fontsize=14)
-    plt.ylabel('True Positive Rate', fontsize=14)
-    plt.title('ROC')
-    plt.legend(loc="lower right")
-    plt.xlim([0.0, 1.0])
-    plt.ylim([0.0, 1.0])
+    _roc_axis_layout(ax)
+
+    return {'auc': {str(class_labels[1]): float(roc_auc[0])}}
     
 
-def roc_chart_multilabel(y_true, y_pred, y_probas, classes, class_labels):
-    # Compute ROC curve and ROC area for each class
-    fpr = dict()
-    tpr = dict()
-    roc_auc = dict()
-    for i,c in enumerate(classes):
-        fpr[i], tpr[i], _ = roc_curve((y_true == c).astype(int), y_probas[:, i])
-        roc_auc[i] = auc(fpr[i], tpr[i])
+def roc_chart_multilabel(y_true, y_pred, y_probas, classes, class_labels, ax=None,
+                         method='exact', n_bins=1000, max_points=500):
+
+    ax = ax if ax is not None else _current_axis()
+
+    # Compute ROC curve and ROC area for all classes
+    fpr, tpr, roc_auc = roc_curves(
+        y_true,
+        y_probas,
+        classes,
+        method=method,
+        n_bins=n_bins,
+        max_points=max_points
+    )
 
     # Plot of a ROC curve for a specific class
-    plt.plot([0, 1], [0, 1], 'k--')
+    ax.plot([0, 1], [0, 1], 'k--')
     for i,c in enumerate(class_labels):
-        plt.plot(
+        ax.plot(
             fpr[i],
             tpr[i],
             label=f'{c} AUC = {str(roc_auc[i])[:4]}'
         )
     
-    plt.xlabel('False Positive Rate', fontsize=14)
-    plt.ylabel('True Positive Rate', fontsize=14)
-    plt.title('ROC')
-    plt.legend(loc="lower right")
-    plt.xlim([0.0, 1.0])
-    plt.ylim([0.0, 1.0])
+    _roc_axis_layout(ax)
+
+    return {
+        'auc': {
+            str(c): float(roc_auc[i])
+            for i, c in enumerate(class_labels)
+        }
+    }
 
 
-def roc_chart(y_true, y_pred, y_probas, classes, class_labels):
+# pyplot is only imported by charts drawn without an axis
+def _current_axis():
+    import matplotlib.pyplot as plt
+    return plt.gca()
+
+
+def _roc_axis_layout(ax):
+    ax.set_xlabel('False Positive Rate', fontsize=14)
+    ax.set_ylabel('True Positive Rate', fontsize=14)
+    ax.set_title('ROC')
+    ax.legend(loc="lower right")
+    ax.set_xlim([0.0, 1.0])
+    ax.set_ylim([0.0, 1.0])
+
+
+def roc_chart(y_true, y_pred, y_probas, classes, class_labels, ax=None, **roc_parameters):
     if np.unique(y_true).shape[0] == 2:
-        roc_chart_binary(y_true, y_pred, y_probas, classes, class_labels)
+        return roc_chart_binary(y_true, y_pred, y_probas, classes, class_labels, ax=ax, **roc_parameters)
     else:
-        roc_chart_multilabel(y_true, y_pred, y_probas, classes, class_labels)
+        return roc_chart_multilabel(y_true, y_pred, y_probas, classes, class_labels, ax=ax, **roc_parameters)
+
 
+def confusion_matrix_chart(y_true, y_pred, y_probas, classes, class_labels, annot=True, cmap='flare', fmt='g', ax=None):
 
-def confusion_matrix_chart(y_true, y_pred, y_probas, classes, class_labels, annot=True, cmap='flare', fmt='g'):
+    ax = ax if ax is not None else _current_axis()
 
     cm = pd.DataFrame(
         confusion_matrix(y_true, y_pred),
@@ -69,5 +205,6 @@ def confusion_matrix_chart(y_true, y_pred, y_probas, classes, class_labels, anno
         index=class_labels,
     )
 
-    sns.heatmap(cm, annot=annot, cmap=cmap, fmt=fmt)
-    plt.title('Confusion matrix')
+    import seaborn as sns
+    sns.heatmap(cm, annot=annot, cmap=cmap, fmt=fmt, ax=ax)
+    ax.set_title('Confusion matrix')
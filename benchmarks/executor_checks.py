@@ -0,0 +1,134 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import wait
+
+from ConPipe.Logger import Logger
+from ConPipe.executors import SocketExecutor, init_worker
+from nodes import worker_task
+from startup_benchmarks import PACKAGE_PATH, _environment
+
+WORKER_PATH = os.path.join(PACKAGE_PATH, 'scripts', 'conpipe_worker')
+AUTHKEY = 'executor-checks'
+
+# Seconds a check waits for its futures before it is considered hung
+TIMEOUT = 60
+
+
+def start_executor(n_workers):
+    """ SocketExecutor on a free localhost port and the processes of its connected workers """
+
+    executor = SocketExecutor(
+        port=0, authkey=AUTHKEY, initializer=init_worker, initargs=(list(sys.path), 0)
+    )
+    workers = [
+        subprocess.Popen(
+            [sys.executable, WORKER_PATH, '--port', str(executor.address[1]), '--authkey', AUTHKEY,
+             '--once', '--verbose', '0'],
+            env=_environment()
+        )
+        for _ in range(n_workers)
+    ]
+
+    deadline = time.monotonic() + TIMEOUT
+    while len(executor._workers) < n_workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'Only {len(executor._workers)} of {n_workers} workers connected')
+        time.sleep(0.05)
+
+    return executor, workers
+
+
+def running_worker(futures, workers):
+    """ Worker process that is running one of the futures """
+
+    pids = {worker.pid: worker for worker in workers if worker.poll() is None}
+    deadline = time.monotonic() + TIMEOUT
+    while True:
+        done = [future.result()[1] for future in futures if future.done() and future.exception() is None]
+        if any(pid in pids for pid in done):
+            # Workers that already returned a task are running the next one
+            return pids[next(pid for pid in done if pid in pids)]
+        if time.monotonic() > deadline:
+            raise RuntimeError('No worker ran a task')
+        time.sleep(0.01)
+
+
+def check_worker_killed():
+    """ Tasks of a worker killed while running them are run by the other workers """
+
+    executor, workers = start_executor(3)
+    futures = [executor.submit(worker_task, value, 0.2) for value in range(30)]
+
+    running_worker(futures, workers).send_signal(signal.SIGKILL)
+    done, not_done = wait(futures, timeout=TIMEOUT)
+    executor.shutdown()
+
+    assert len(not_done) == 0, f'{len(not_done)} tasks hung after a worker was killed'
+    assert [future.result()[0] for future in futures] == list(range(30))
+    _stop(workers)
+
+
+def check_worker_killed_after_shutdown():
+    """ Tasks requeued after shutdown are still run by the other workers """
+
+    executor, workers = start_executor(2)
+    futures = [executor.submit(worker_task, value, 0.2) for value in range(10)]
+    executor.shutdown(wait=False)
+
+    running_worker(futures, workers).send_signal(signal.SIGKILL)
+    done, not_done = wait(futures, timeout=TIMEOUT)
+
+    assert len(not_done) == 0, f'{len(not_done)} tasks hung after a worker was killed during shutdown'
+    assert [future.result()[0] for future in futures] == list(range(10))
+    _stop(workers)
+
+
+def check_all_workers_killed_after_shutdown():
+    """ Tasks left without workers after shutdown fail instead of hanging """
+
+    executor, workers = start_executor(2)
+    futures = [executor.submit(worker_task, value, 0.5) for value in range(10)]
+    executor.shutdown(wait=False)
+
+    running_worker(futures, workers)
+    for worker in workers:
+        worker.send_signal(signal.SIGKILL)
+    done, not_done = wait(futures, timeout=TIMEOUT)
+
+    assert len(not_done) == 0, f'{len(not_done)} tasks hung after every worker was killed during shutdown'
+    assert any(isinstance(future.exception(), RuntimeError) for future in futures)
+    _stop(workers)
+
+
+def _stop(workers):
+    for worker in workers:
+        if worker.poll() is None:
+            worker.kill()
+        worker.wait()
+
+
+CHECKS = (
+    check_worker_killed,
+    check_worker_killed_after_shutdown,
+    check_all_workers_killed_after_shutdown
+)
+
+
+if __name__ == '__main__':
+
+    # Runs the socket executor with workers in localhost processes, killing some of them
+    Logger(0)
+
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f'{check.__name__}: ok')
+        except AssertionError as error:
+            failed += 1
+            print(f'{check.__name__}: failed, {error}')
+
+    sys.exit(1 if failed > 0 else 0)
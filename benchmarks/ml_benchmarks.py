@@ -0,0 +1,84 @@
+import os
+
+from sklearn.model_selection import ParameterGrid
+
+from ConPipe.GraphNode.ModelSelection import ModelSelection
+from ConPipe.GraphNode.ResultEvaluation import ResultEvaluation
+from nodes import classification_data, synthetic_predictions
+from timing import measure, result
+
+N_SPLITS = 3
+
+MODELS = {
+    'LogisticRegression': {
+        'class': 'sklearn.linear_model.LogisticRegression',
+        'constructor_params': {'max_iter': 1000},
+        'param_grid': {'C': [0.1, 1.0]}
+    },
+    'DecisionTreeClassifier': {
+        'class': 'sklearn.tree.DecisionTreeClassifier',
+        'constructor_params': {'random_state': 0},
+        'param_grid': {'max_depth': [3, 6]}
+    }
+}
+
+SCORES = {
+    'accuracy': {'function': 'sklearn.metrics.accuracy_score', 'score_type': 'pred'},
+    'f1_score': {
+        'function': 'sklearn.metrics.f1_score',
+        'score_type': 'pred',
+        'parameters': {'average': 'weighted'}
+    }
+}
+
+CHARTS = {
+    'roc': {'function': 'ConPipe.visualizations.roc_chart'},
+    'confusion_matrix': {'function': 'ConPipe.visualizations.confusion_matrix_chart'}
+}
+
+
+def model_selection(search_mode, n_jobs=1):
+    return ModelSelection(
+        parameter_optimizer={
+            'class': 'sklearn.model_selection.GridSearchCV',
+            'parameters': {'refit': True, 'n_jobs': n_jobs}
+        },
+        scoring={'function': 'sklearn.metrics.f1_score', 'parameters': {'average': 'weighted'}},
+        cv={
+            'class': 'sklearn.model_selection.StratifiedKFold',
+            'parameters': {'n_splits': N_SPLITS, 'shuffle': True, 'random_state': 0}
+        },
+        models=MODELS,
+        search_mode=search_mode
+    )
+
+
+def run(directory, sizes, repeat):
+
+    results = []
+    # Each candidate of the grids is fitted once per split
+    n_fits = N_SPLITS * sum(len(ParameterGrid(model['param_grid'])) for model in MODELS.values())
+
+    for n_samples in sizes:
+        data = classification_data(n_samples=n_samples)
+        for search_mode in ('per_model', 'shared_pool'):
+            timings = measure(lambda: model_selection(search_mode).run(data['X'], data['y']), repeat)
+            results.append(result(
+                'ml', 'model_selection', {'search_mode': search_mode, 'n_samples': n_samples},
+                'fits_per_second', n_fits / timings['median'], 'fits/s', timings
+            ))
+
+        for n_classes in (2, 10):
+            y_true, y_pred, y_probas, classes = synthetic_predictions(n_samples, n_classes)
+            class_labels = {c: f'class_{c}' for c in classes}
+            params = {'n_samples': n_samples, 'n_classes': n_classes}
+
+            evaluation = ResultEvaluation(SCORES, {}, os.path.join(directory, 'results'), 'bench')
+            timings = measure(lambda: evaluation.run(y_true, y_pred, y_probas, classes, class_labels), repeat)
+            results.append(result('ml', 'result_evaluation_scores', params, 'latency', timings['median'], 's', timings))
+
+            evaluation = ResultEvaluation(SCORES, CHARTS, os.path.join(directory, 'results'), 'bench')
+            timings = measure(lambda: evaluation.run(y_true, y_pred, y_probas, classes, class_labels), repeat)
+            results.append(result('ml', 'result_evaluation', params, 'latency', timings['median'], 's', timings))
+
+    return results
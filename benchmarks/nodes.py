@@ -0,0 +1,46 @@
+import os
+import time
+
+import numpy as np
+from sklearn.datasets import make_classification
+
+
+# Node functions used by the generated benchmark graphs
+
+def source(size=1, seed=0):
+    return {'value': np.random.RandomState(seed).rand(size)}
+
+
+def passthrough(*args, **kwargs):
+    values = list(args) + list(kwargs.values())
+    return {'value': values[0] if len(values) > 0 else None}
+
+
+def classification_data(n_samples=1000, n_features=20, n_classes=2, seed=0):
+    X, y = make_classification(
+        n_samples=n_samples,
+        n_features=n_features,
+        n_informative=min(n_features, max(2, n_classes)),
+        n_classes=n_classes,
+        random_state=seed
+    )
+    return {
+        'X': X,
+        'y': y,
+        'class_labels': {str(c): f'class_{c}' for c in range(n_classes)}
+    }
+
+
+def synthetic_predictions(n_samples, n_classes, seed=0):
+    rng = np.random.RandomState(seed)
+    classes = np.arange(n_classes)
+    y_true = rng.randint(n_classes, size=n_samples)
+    y_probas = rng.dirichlet(np.ones(n_classes), size=n_samples)
+    y_probas[np.arange(n_samples), y_true] += 0.5
+    y_probas /= y_probas.sum(axis=1, keepdims=True)
+    return y_true, classes[np.argmax(y_probas, axis=1)], y_probas, classes
+
+
+def worker_task(value, duration=0.0):
+    time.sleep(duration)
+    return value, os.getpid()
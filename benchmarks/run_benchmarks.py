@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from ConPipe.Logger import Logger
+import ml_benchmarks
+import runner_benchmarks
+import startup_benchmarks
+import storage_benchmarks
+
+SUITES = {
+    'startup': startup_benchmarks,
+    'runner': runner_benchmarks,
+    'storage': storage_benchmarks,
+    'ml': ml_benchmarks
+}
+
+# Data sizes of each suite: number of nodes, rows and samples
+SIZES = {
+    'startup': [10, 100],
+    'runner': [10, 100],
+    'storage': [10_000, 1_000_000],
+    'ml': [1_000, 10_000]
+}
+
+QUICK_SIZES = {
+    'startup': [10],
+    'runner': [10],
+    'storage': [10_000],
+    'ml': [1_000]
+}
+
+# Metrics where lower values are better, for the rest higher values are better
+LOWER_IS_BETTER = ('time', 'time_per_node', 'latency')
+
+
+def main(suites, output_path, baseline_path=None, repeat=5, quick=False, tolerance=0.2):
+
+    # Benchmarked nodes must not print
+    Logger(0)
+
+    sizes = QUICK_SIZES if quick else SIZES
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for suite in suites:
+            print(f'Running {suite} benchmarks')
+            suite_dir = os.path.join(directory, suite)
+            os.makedirs(suite_dir)
+            results.extend(SUITES[suite].run(suite_dir, sizes[suite], repeat))
+
+    report = {
+        'metadata': {
+            'timestamp': datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__,
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'Results saved to {output_path}')
+
+    if baseline_path is None:
+        return 0
+
+    with open(baseline_path, 'r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare(baseline['results'], results, tolerance)
+    for regression in regressions:
+        print(
+            f'Regression in {regression["key"]}: {regression["baseline"]:.6g} -> '
+            f'{regression["value"]:.6g} {regression["unit"]} ({regression["change"]:+.1%})'
+        )
+    print(f'{len(regressions)} regressions with a tolerance of {tolerance:.0%}')
+
+    return 1 if len(regressions) > 0 else 0
+
+
+def compare(baseline_results, results, tolerance):
+    """ Results whose metric got worse than the baseline by more than tolerance (relative) """
+
+    baseline_values = {_result_key(result): result for result in baseline_results}
+
+    regressions = []
+    for result in results:
+        key = _result_key(result)
+        if key not in baseline_values or result['metric'] == 'size':
+            continue
+
+        baseline_value = baseline_values[key]['value']
+        if baseline_value == 0:
+            continue
+
+        change = (result['value'] - baseline_value) / baseline_value
+        worse = change > tolerance if result['metric'] in LOWER_IS_BETTER else change < -tolerance
+        if worse:
+            regressions.append({
+                'key': key,
+                'baseline': baseline_value,
+                'value': result['value'],
+                'unit': result['unit'],
+                'change': change
+            })
+
+    return regressions
+
+
+def _result_key(result):
+    return f'{result["suite"]}.{result["name"]}.{result["metric"]}' \
+        f'[{json.dumps(result["params"], sort_keys=True)}]'
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run the ConPipe benchmarks and save the results as JSON')
+
+    parser.add_argument(
+        '--suites',
+        type=lambda suites: suites.split(','),
+        default=list(SUITES.keys()),
+        help=f'Comma separated benchmark suites to run, options are: {", ".join(SUITES.keys())}'
+    )
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='benchmark_results.json',
+        help='Path of the JSON file where to save the results.'
+    )
+
+    parser.add_argument(
+        '--baseline',
+        type=str,
+        default=None,
+        help='Path of a previous results JSON file to compare against. Exits with code 1 if there are regressions.'
+    )
+
+    parser.add_argument('--repeat', type=int, default=5, help='Times each benchmark is run.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative change considered a regression.')
+    parser.add_argument('--quick', action='store_true', help='Run only the smallest data sizes.')
+
+    args = parser.parse_args()
+
+    for suite in args.suites:
+        if suite not in SUITES:
+            raise ValueError(f'Benchmark suite {suite} non existent, options are: {", ".join(SUITES.keys())}')
+
+    sys.exit(main(args.suites, args.output, args.baseline, args.repeat, args.quick, args.tolerance))
@@ -0,0 +1,138 @@
+import os
+import yaml
+
+from ConPipe.GraphRunner import GraphRunner
+from timing import measure, result
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Width and array size (float64 values) of the graph that measures the process executor transports
+TRANSPORT_WIDTH = 4
+TRANSPORT_SIZE = 2 ** 23
+
+
+def wide_graph(width, size=1, storage_type=None):
+    """ A source node, width nodes that read it and a sink node that reads all of them """
+
+    config = {'source': _node('nodes.source', {}, storage_type, {'size': size})}
+    for i in range(width):
+        config[f'node_{i}'] = _node('nodes.passthrough', {'source': {'value': 'value'}}, storage_type)
+
+    config['sink'] = _node(
+        'nodes.passthrough',
+        {f'node_{i}': {f'value_{i}': 'value'} for i in range(width)},
+        storage_type
+    )
+    return config
+
+
+def deep_graph(depth, size=1, storage_type=None):
+    """ A chain of depth nodes, each one reading the previous one """
+
+    config = {'node_0': _node('nodes.source', {}, storage_type, {'size': size})}
+    for i in range(1, depth):
+        config[f'node_{i}'] = _node('nodes.passthrough', {f'node_{i - 1}': {'value': 'value'}}, storage_type)
+    return config
+
+
+def write_config(directory, graph_config, executor=None):
+
+    config = {
+        'general': {
+            'verbose': 0,
+            'save_path': os.path.join(directory, 'out'),
+            'module_paths': [BENCHMARKS_PATH]
+        },
+        **graph_config
+    }
+    if executor is not None:
+        config['general']['executor'] = executor if isinstance(executor, dict) else {'type': executor}
+
+    config_path = os.path.join(directory, 'graph.yaml')
+    with open(config_path, 'w', encoding='utf-8') as config_file:
+        yaml.safe_dump(config, config_file)
+
+    return config_path
+
+
+def run(directory, sizes, repeat):
+
+    results = []
+    for n_nodes in sizes:
+        for shape, make_graph in (('wide', wide_graph), ('deep', deep_graph)):
+            params = {'shape': shape, 'n_nodes': n_nodes}
+
+            # Construction with a warm cache, whose outputs are indexed by _load_nodes_output
+            graph_dir = os.path.join(directory, f'{shape}_{n_nodes}_cached')
+            os.makedirs(graph_dir, exist_ok=True)
+            config_path = write_config(graph_dir, make_graph(n_nodes, storage_type='npy'))
+            GraphRunner([config_path], {}).run()
+
+            timings = measure(lambda: GraphRunner._load_config([config_path], {}), repeat)
+            results.append(result('runner', 'load_config', params, 'time', timings['median'], 's', timings))
+
+            timings = measure(lambda: GraphRunner([config_path], {}), repeat)
+            results.append(result('runner', 'construction', params, 'time', timings['median'], 's', timings))
+
+            runner = GraphRunner([config_path], {})
+            timings = measure(runner._load_nodes_output, repeat)
+            results.append(result('runner', 'load_nodes_output', params, 'time', timings['median'], 's', timings))
+
+            # Scheduling overhead of nodes that do nothing and save nothing
+            for executor in ('sequential', 'thread'):
+                graph_dir = os.path.join(directory, f'{shape}_{n_nodes}_{executor}')
+                os.makedirs(graph_dir, exist_ok=True)
+                config_path = write_config(graph_dir, make_graph(n_nodes), executor)
+
+                runners = []
+                timings = measure(
+                    lambda: runners[-1].run(),
+                    repeat,
+                    setup=lambda: runners.append(GraphRunner([config_path], {}))
+                )
+                n_graph_nodes = len(runners[-1].graph_.nodes())
+                results.append(result(
+                    'runner', 'scheduling_overhead', {**params, 'executor': executor},
+                    'time_per_node', timings['median'] / n_graph_nodes, 's', timings
+                ))
+
+    # Process executor runs of a wide graph with a large array, pickling the inputs
+    # and outputs of every node or sending them through shared memory
+    for shared_memory in (False, True):
+        graph_dir = os.path.join(directory, f'transport_{"shared_memory" if shared_memory else "pickle"}')
+        os.makedirs(graph_dir, exist_ok=True)
+        config_path = write_config(
+            graph_dir,
+            wide_graph(TRANSPORT_WIDTH, size=TRANSPORT_SIZE),
+            {'type': 'process', 'max_workers': TRANSPORT_WIDTH, 'shared_memory': shared_memory}
+        )
+
+        runners = []
+        timings = measure(
+            lambda: runners[-1].run(),
+            repeat,
+            setup=lambda: runners.append(GraphRunner([config_path], {}))
+        )
+        results.append(result(
+            'runner', 'process_transport',
+            {'width': TRANSPORT_WIDTH, 'size': TRANSPORT_SIZE, 'shared_memory': shared_memory},
+            'time', timings['median'], 's', timings
+        ))
+
+    return results
+
+
+def _node(function, input_map, storage_type, parameters=None):
+
+    node = {
+        'function': function,
+        'cache_output': storage_type is not None
+    }
+    if len(input_map) > 0:
+        node['input_map'] = input_map
+    if parameters is not None:
+        node['parameters'] = parameters
+    if storage_type is not None:
+        node['output_storage_type'] = storage_type
+
+    return node
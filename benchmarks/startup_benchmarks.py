@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+from ConPipe.GraphRunner import GraphRunner
+from runner_benchmarks import deep_graph, write_config
+from timing import measure, result
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(PACKAGE_PATH, 'scripts', 'run_ml_experiment')
+
+IMPORTED_MODULES = (
+    'ConPipe.GraphRunner',
+    'ConPipe.GraphNode.ModelSelection',
+    'ConPipe.GraphNode.ModelPrediction',
+    'ConPipe.GraphNode.ResultEvaluation',
+    'ConPipe.visualizations'
+)
+
+
+def import_time(module_name):
+    """ Cumulative import time in seconds of module_name in a new interpreter, from python -X importtime """
+
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+        capture_output=True, text=True, check=True, env=_environment()
+    )
+
+    # Lines are "import time: self [us] | cumulative | imported package", the module itself is the last one
+    for line in reversed(process.stderr.splitlines()):
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module_name:
+            return int(fields[1]) / 1e6
+
+    raise ValueError(f'Import time of {module_name} not found')
+
+
+def run(directory, sizes, repeat):
+
+    results = []
+    for module_name in IMPORTED_MODULES:
+        times = [import_time(module_name) for _ in range(repeat)]
+        results.append(result(
+            'startup', 'import', {'module': module_name}, 'time', sorted(times)[len(times) // 2], 's'
+        ))
+
+    # Command line run of a graph whose nodes are all cached
+    for n_nodes in sizes:
+        graph_dir = os.path.join(directory, f'cached_{n_nodes}')
+        os.makedirs(graph_dir)
+        config_path = write_config(graph_dir, deep_graph(n_nodes, storage_type='npy'))
+        GraphRunner([config_path], {}).run()
+
+        timings = measure(
+            lambda: subprocess.run([sys.executable, CLI_PATH, config_path], check=True, env=_environment()),
+            repeat
+        )
+        results.append(result('startup', 'cli_cached_run', {'n_nodes': n_nodes}, 'time', timings['median'], 's', timings))
+
+    return results
+
+
+def _environment():
+    return {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join([PACKAGE_PATH] + [p for p in [os.environ.get('PYTHONPATH', None)] if p])
+    }
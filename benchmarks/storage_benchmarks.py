@@ -0,0 +1,55 @@
+import importlib.util
+import os
+import numpy as np
+import pandas as pd
+
+from ConPipe.storage import STORAGE_EXTENSIONS, output_file_name, output_files, output_size, save_value, load_value
+from timing import measure, result
+
+# Storage types that need an optional dependency
+COLUMNAR_STORAGE_TYPES = ('parquet', 'feather')
+
+
+def sample_value(storage_type, n_rows, n_columns=10, seed=0):
+
+    data = np.random.RandomState(seed).rand(n_rows, n_columns)
+
+    if storage_type == 'json':
+        return data.tolist()
+
+    if storage_type in ('csv', 'parquet', 'feather'):
+        return pd.DataFrame(data, columns=[f'column_{i}' for i in range(n_columns)])
+
+    return data
+
+
+def run(directory, sizes, repeat):
+
+    results = []
+    for storage_type in STORAGE_EXTENSIONS.keys():
+        if storage_type in COLUMNAR_STORAGE_TYPES and importlib.util.find_spec('pyarrow') is None:
+            continue
+
+        for n_rows in sizes:
+            value = sample_value(storage_type, n_rows)
+            path = os.path.join(directory, output_file_name(f'{storage_type}_{n_rows}', storage_type))
+
+            save_timings = measure(lambda: save_value(value, path, storage_type), repeat)
+            load_timings = measure(lambda: load_value(path, storage_type), repeat)
+
+            n_megabytes = output_size(output_files(path, storage_type)) / 2 ** 20
+            params = {'storage_type': storage_type, 'n_rows': n_rows}
+            results.append(result(
+                'storage', 'save', params, 'throughput',
+                n_megabytes / save_timings['median'], 'MB/s', save_timings
+            ))
+            results.append(result(
+                'storage', 'load', params, 'throughput',
+                n_megabytes / load_timings['median'], 'MB/s', load_timings
+            ))
+            results.append(result('storage', 'file_size', params, 'size', n_megabytes, 'MB'))
+
+            for file_path in output_files(path, storage_type):
+                os.remove(file_path)
+
+    return results
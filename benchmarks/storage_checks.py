@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+
+from ConPipe.GraphNode.ModelSelection import ModelSelection
+from ConPipe.Logger import Logger
+from ConPipe.storage import output_file_name, save_value, load_value
+from nodes import classification_data
+
+# Models whose cv_results_ have dict, list and mixed type parameter columns
+MODELS = {
+    'LogisticRegression': {
+        'class': 'sklearn.linear_model.LogisticRegression',
+        'constructor_params': {'max_iter': 1000},
+        'param_grid': {'C': [0.1, 1]}
+    },
+    'MultiLayerPerceptron': {
+        'class': 'sklearn.neural_network.MLPClassifier',
+        'constructor_params': {'max_iter': 50, 'random_state': 0},
+        'param_grid': {'hidden_layer_sizes': [[4], [4, 2]]}
+    },
+    'SupportVectorMachine': {
+        'class': 'sklearn.svm.SVC',
+        'constructor_params': {'probability': True, 'random_state': 0},
+        'param_grid': {'gamma': ['auto', 0.1]}
+    }
+}
+
+
+def cv_results(search_mode):
+    data = classification_data(n_samples=200, n_features=5)
+    model_selection = ModelSelection(
+        parameter_optimizer={'class': 'sklearn.model_selection.GridSearchCV', 'parameters': {'refit': True}},
+        scoring={'function': 'sklearn.metrics.f1_score', 'parameters': {'average': 'weighted'}},
+        cv={'class': 'sklearn.model_selection.StratifiedKFold', 'parameters': {'n_splits': 2}},
+        models=MODELS,
+        search_mode=search_mode
+    )
+    return model_selection.run(data['X'], data['y'])['cv_results_']
+
+
+def check_cv_results_round_trip():
+    """ Multi model cv_results_ are loaded from parquet and feather as they were saved """
+
+    with tempfile.TemporaryDirectory() as directory:
+        for search_mode in ('per_model', 'shared_pool'):
+            results = cv_results(search_mode).reset_index(drop=True)
+            for storage_type in ('parquet', 'feather'):
+                path = os.path.join(directory, output_file_name(f'cv_results_{search_mode}', storage_type))
+                save_value(results, path, storage_type)
+                loaded = load_value(path, storage_type)
+
+                assert loaded.equals(results), f'{search_mode} cv_results_ changed in a {storage_type} round trip'
+                assert list(loaded['params']) == list(results['params']), \
+                    f'{search_mode} params changed in a {storage_type} round trip'
+
+                columns = load_value(path, storage_type, options={'columns': ['model_name', 'params']})
+                assert columns.equals(results[['model_name', 'params']]), \
+                    f'{search_mode} columns changed in a {storage_type} round trip with columns'
+
+
+def check_tree_ensembles_out_of_band():
+    """ The tree arrays of fitted forests and boosting models are saved out of band in pickle5 """
+
+    data = classification_data(n_samples=2000, n_features=20)
+    estimators = (
+        RandomForestClassifier(n_estimators=50, random_state=0),
+        RandomForestClassifier(n_estimators=50, max_depth=3, random_state=0),
+        GradientBoostingClassifier(n_estimators=50, random_state=0)
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        for estimator_idx, estimator in enumerate(estimators):
+            estimator.fit(data['X'], data['y'])
+            name = type(estimator).__name__
+            path = os.path.join(directory, output_file_name(f'estimator_{estimator_idx}', 'pickle5'))
+
+            stats = save_value(estimator, path, 'pickle5')
+            assert stats['out_of_band_buffers'] >= estimator.n_estimators, \
+                f'{name} saved {stats["out_of_band_buffers"]} buffers out of band for {estimator.n_estimators} trees'
+
+            loaded = load_value(path, 'pickle5')
+            assert np.array_equal(loaded.predict_proba(data['X']), estimator.predict_proba(data['X'])), \
+                f'{name} predictions changed in a pickle5 round trip'
+
+
+CHECKS = (
+    check_cv_results_round_trip,
+    check_tree_ensembles_out_of_band
+)
+
+
+if __name__ == '__main__':
+
+    # Saves and loads real node outputs with the storage types
+    Logger(0)
+
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f'{check.__name__}: ok')
+        except AssertionError as error:
+            failed += 1
+            print(f'{check.__name__}: failed, {error}')
+
+    sys.exit(1 if failed > 0 else 0)
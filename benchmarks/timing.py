@@ -0,0 +1,36 @@
+import time
+import numpy as np
+
+
+def measure(function, repeat=5, setup=None):
+    """ Runs function repeat times (after setup, which is not timed) and returns
+    the statistics of its wall times in seconds
+    """
+
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    return {
+        'min': float(np.min(times)),
+        'median': float(np.median(times)),
+        'mean': float(np.mean(times)),
+        'repeat': repeat
+    }
+
+
+def result(suite, name, params, metric, value, unit, timings=None):
+    return {
+        'suite': suite,
+        'name': name,
+        'params': params,
+        'metric': metric,
+        'value': value,
+        'unit': unit,
+        'timings': timings
+    }
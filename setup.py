@@ -10,7 +10,8 @@ setup(
     author_email='laouen.belloli@gmail.com',
     package=['ConPipe'],
     scripts=[
-        'scripts/run_ml_experiment'
+        'scripts/run_ml_experiment',
+        'scripts/conpipe_worker'
     ],
     install_requires=[
         'PyYAML',
@@ -20,5 +21,9 @@ setup(
         'matplotlib',
         'graph-theory',
         'hiyapyco'
-    ]
+    ],
+    extras_require={
+        # parquet and feather output storage types
+        'columnar': ['pyarrow']
+    }
 )